@@ -4,14 +4,28 @@
 from utils import argmin_random_tie, count, first
 import search
 
-from collections import defaultdict
+from collections import defaultdict, deque
 from functools import reduce
+from types import MappingProxyType
 
+from array import array
+
+import bisect
+import copy
+import heapq
 import itertools
+import multiprocessing
+import operator
+import os
 import re
 import random
 import sys, getopt
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class CSP(search.Problem):
     """This class describes finite-domain Constraint Satisfaction Problems.
@@ -22,13 +36,25 @@ class CSP(search.Problem):
                     the other variables that participate in constraints.
         constraints A function f(A, a, B, b) that returns true if neighbors
                     A, B satisfy the constraint when they have values A=a, B=b
+        global_constraints  Optional list of constraints over many variables,
+                    such as AllDifferent; see propagate_globals.
 
 
+    Objects in the monitors list are told about every change through
+    on_assign(var, val), on_unassign(var), on_prune(var, val),
+    on_restore(var, val) and on_weight(A, B); orderings use this to keep
+    their bookkeeping up to date instead of rescanning the problem.
+
     The following are just for debugging purposes:
         display(a)              Print a human-readable representation
+
+    For large problems, compile() returns an equivalent CompiledCSP that
+    works on dense integers and bitsets; every solver here accepts either.
+    After count_conflicts(), nconflicts on the assignment being built by
+    assign and unassign is a table lookup.
     """
 
-    def __init__(self, variables, domains, neighbors, constraints):
+    def __init__(self, variables, domains, neighbors, constraints, global_constraints=()):
         """Construct a CSP problem. If variables is empty, it becomes domains.keys()."""
         variables = variables or list(domains.keys())
 
@@ -36,30 +62,52 @@ class CSP(search.Problem):
         self.domains = domains
         self.neighbors = neighbors
         self.constraints = constraints
+        self.global_constraints = list(global_constraints)
+        self.globals_of = {var: [] for var in variables}
+        for constraint in self.global_constraints:
+            for var in constraint.scope:
+                self.globals_of[var].append(constraint)
         self.initial = ()
         self.curr_domains = None
+        self.trail = []
+        self.residues = {}
+        self.weights = {}
+        self.monitors = []
         self.nassigns = 0
-
+        self.counter = None
+        self.graph = None
 
     def assign(self, var, val, assignment):
         """Add {var: val} to assignment; Discard the old value if any."""
+        if self.counter is not None:
+            self.counter.follow(assignment)
         assignment[var] = val
         self.nassigns += 1
+        for monitor in self.monitors:
+            monitor.on_assign(var, val)
 
     def unassign(self, var, assignment):
         """Remove {var: val} from assignment.
         DO NOT call this if you are changing a variable to a new value;
         just call assign for that."""
         if var in assignment:
+            if self.counter is not None:
+                self.counter.follow(assignment)
             del assignment[var]
+            for monitor in self.monitors:
+                monitor.on_unassign(var)
 
     def nconflicts(self, var, val, assignment):
         """Return the number of conflicts var=val has with other variables."""
         # Subclasses may implement this more efficiently
+        if self.counter is not None and self.counter.knows(var, val, assignment):
+            return self.counter.nconflicts(var, val)
+
         def conflict(var2):
             return (var2 in assignment and
-                    not self.constraints(var, val, var2, assignment))
-        return count(conflict(v) for v in self.neighbors[var])
+                    not self.constraints(var, val, var2, assignment[var2]))
+        return (count(conflict(v) for v in self.neighbors[var]) +
+                sum(g.nconflicts(self, var, val, assignment) for g in self.globals_of[var]))
 
     def display(self, assignment):
         """Show a human-readable representation of the CSP."""
@@ -71,49 +119,1026 @@ class CSP(search.Problem):
         if var in assignment:
             #if assignment[var]
             domain.append(assignment[var])
-            print(var, "sadas")
         else:
             domain = [val for val in self.domains[var] if (self.nconflicts(var, val, assignment) == 0)]
 
         return domain
 
 
+    def linked(self, var):
+        """The variables var shares a constraint with, whichever side lists
+        it: constraint_graph(self)[var], built on first use. Set graph to
+        None after changing the neighbors."""
+        if self.graph is None:
+            self.graph = constraint_graph(self)
+        return self.graph[var]
+
+    def count_conflicts(self):
+        """From now on keep a ConflictCounter following the assignment
+        handed to assign and unassign, so nconflicts on that assignment
+        looks its answer up instead of checking every neighbor. The
+        assignment must then change only through those calls. Call this
+        again after changing domains or constraints, to count afresh."""
+        if self.counter is not None:
+            self.counter.detach()
+        self.counter = ConflictCounter(self)
+        return self.counter
+
     def goal_test(self, state):
         """The goal is to assign all variables, with all constraints satisfied."""
-        assignment = dict(state)
+        assignment = state if isinstance(state, dict) else dict(state)
         return (len(assignment) == len(self.variables)
                 and all(self.nconflicts(variables, assignment[variables], assignment) == 0
                         for variables in self.variables))
 
-    # These are for constraint propagation
+    # These are for constraint propagation. Every domain change is pushed
+    # on self.trail, so undoing a supposition just unwinds the trail back
+    # to the checkpoint suppose() returned: the "removals" handed to prune
+    # and restore is that checkpoint, not a list.
 
     def support_pruning(self):
         """Make sure we can prune values from domains. (We want to pay
         for this only if we use it.)"""
         if self.curr_domains is None:
-            self.curr_domains = {v: list(self.domains[v]) for v in self.variables}
+            self.curr_domains = {v: ReversibleDomain(self.domains[v]) for v in self.variables}
 
     def suppose(self, var, value):
         """Start accumulating inferences from assuming var=value."""
         self.support_pruning()
-        removals = [(var, a) for a in self.curr_domains[var] if a != value]
-        self.curr_domains[var] = [value]
-        return removals
+        checkpoint = len(self.trail)
+        domain = self.curr_domains[var]
+        self.trail.append((var, domain.size))
+        domain.keep_only(value)
+        for monitor in self.monitors:
+            for a in domain.items[1:self.trail[-1][1]]:
+                monitor.on_prune(var, a)
+        return checkpoint
+
+    def prune(self, var, value, removals):
+        """Rule out var=value."""
+        domain = self.curr_domains[var]
+        self.trail.append((var, domain.size))
+        domain.remove(value)
+        for monitor in self.monitors:
+            monitor.on_prune(var, value)
+
+    def choices(self, var):
+        """Return all values for var that aren't currently ruled out."""
+        if self.curr_domains is None:
+            return self.domains[var]
+        return list(self.curr_domains[var])
+
+    def domain_size(self, var):
+        """Return the number of values still possible for var."""
+        if self.curr_domains is None:
+            return len(self.domains[var])
+        return self.curr_domains[var].size
+
+    def restore(self, removals):
+        """Undo a supposition and all inferences from it."""
+        trail, curr_domains, monitors = self.trail, self.curr_domains, self.monitors
+        while len(trail) > removals:
+            var, size = trail.pop()
+            domain = curr_domains[var]
+            for monitor in monitors:
+                for b in domain.items[domain.size:size]:
+                    monitor.on_restore(var, b)
+            domain.size = size
+
+    def label(self, var, val):
+        """The value val of var as the problem states it (see CompiledCSP)."""
+        return val
+
+    def unlabel(self, var, label):
+        """Inverse of label(); None if label is not a value of var."""
+        return label
+
+    def weight(self, A, B):
+        """Return the weight of the constraint between A and B: one plus
+        the number of domain wipeouts it has caused."""
+        return self.weights.get((A, B), 1)
+
+    def bump_weight(self, A, B):
+        """Record that the constraint between A and B wiped out a domain."""
+        self.weights[A, B] = self.weights[B, A] = self.weight(A, B) + 1
+        for monitor in self.monitors:
+            monitor.on_weight(A, B)
+
+    def compile(self, matrices=False):
+        """Return a CompiledCSP equivalent to this problem; with
+        matrices=True, a MatrixCSP (which needs numpy)."""
+        return MatrixCSP(self) if matrices else CompiledCSP(self)
+
+
+class ReversibleDomain:
+    """The current domain of one variable, kept as a sparse set: the values
+    still possible are items[:size], and position maps every value to its
+    index in items. Removing a value swaps it just past the end of the live
+    part, so removals are O(1) and are undone, in LIFO order, by putting
+    size back; CSP.restore does that from the trail."""
+
+    __slots__ = ('items', 'position', 'size')
+
+    def __init__(self, values):
+        self.items = list(values)
+        self.position = {value: i for i, value in enumerate(self.items)}
+        self.size = len(self.items)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.items[:self.size])
+
+    def __contains__(self, value):
+        return self.position.get(value, self.size) < self.size
+
+    def __repr__(self):
+        return repr(self.items[:self.size])
+
+    def swap(self, i, j):
+        items, position = self.items, self.position
+        items[i], items[j] = items[j], items[i]
+        position[items[i]] = i
+        position[items[j]] = j
+
+    def remove(self, value):
+        i = self.position[value]
+        if i >= self.size:
+            raise ValueError('{!r} is not in the domain'.format(value))
+        self.size -= 1
+        self.swap(i, self.size)
+
+    def keep_only(self, value):
+        self.swap(self.position[value], 0)
+        self.size = 1
+
+
+class Monitor:
+    """Something in csp.monitors that wants to hear about changes to the
+    CSP: the on_* hooks below. backtracking_search also reports
+    on_backtrack(var) when every value of var failed, on_restart() when
+    it gives up a run to start again, and on_solution(assignment).
+    Subclasses override the hooks they care about."""
+
+    def attach(self, csp):
+        self.csp = csp
+        csp.monitors.append(self)
+
+    def detach(self):
+        self.csp.monitors.remove(self)
+
+    def on_assign(self, var, val):
+        pass
+
+    def on_unassign(self, var):
+        pass
+
+    def on_prune(self, var, val):
+        pass
+
+    def on_restore(self, var, val):
+        pass
+
+    def on_weight(self, A, B):
+        pass
+
+    def on_backtrack(self, var):
+        pass
+
+    def on_restart(self):
+        pass
+
+    def on_solution(self, assignment):
+        pass
+
+
+# ______________________________________________________________________________
+# Compiled representation
+
+
+def bits(mask):
+    """Yield the indices of the bits set in mask, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def transpose(rows, width):
+    """Transpose a boolean matrix stored as bitset rows of the given width."""
+    cols = [0] * width
+    for a, row in enumerate(rows):
+        for b in bits(row):
+            cols[b] |= 1 << a
+    return cols
+
+
+class TableConstraint:
+    """An extensional binary constraint, given once as a chart
+    {value: [compatible values, ...]} and applied to every pair of
+    neighbors. The chart is compiled into bitset rows over the values, so
+    a call constraints(A, a, B, b) is one lookup and a shift; with
+    mutual=True a pair is allowed only if each value lists the other.
+    CSP.compile() copies the rows straight into its arc tables."""
+
+    def __init__(self, chart, mutual=False):
+        values = list(chart)
+        for compatible in chart.values():
+            values.extend(b for b in compatible if b not in chart)
+        self.values = list(dict.fromkeys(values))
+        self.index = {value: k for k, value in enumerate(self.values)}
+        rows = [0] * len(self.values)
+        for a, compatible in chart.items():
+            for b in compatible:
+                rows[self.index[a]] |= 1 << self.index[b]
+        if mutual:
+            rows = [row & col for row, col in zip(rows, transpose(rows, len(rows)))]
+        self.rows = rows
+
+    def __call__(self, A, a, B, b):
+        index = self.index
+        return a in index and b in index and self.rows[index[a]] >> index[b] & 1 == 1
+
+    def allow(self, a, b, allowed=True):
+        """Allow (or with allowed=False, forbid) value a next to value b,
+        both values of the chart; the pair (b, a) is left as it is."""
+        if allowed:
+            self.rows[self.index[a]] |= 1 << self.index[b]
+        else:
+            self.rows[self.index[a]] &= ~(1 << self.index[b])
+
+    def rows_for(self, values_a, values_b):
+        """The table restricted to two lists of values, as bitset rows:
+        bit l of row k is set iff (values_a[k], values_b[l]) is allowed."""
+        values_a, values_b = list(values_a), list(values_b)
+        if values_a == self.values and values_b == self.values:
+            return list(self.rows)
+        index, rows = self.index, self.rows
+        columns = [(l, index[b]) for l, b in enumerate(values_b) if b in index]
+        result = []
+        for a in values_a:
+            row = rows[index[a]] if a in index else 0
+            result.append(sum(1 << l for l, k in columns if row >> k & 1))
+        return result
+
+    def arc_rows(self, values_a, values_b, forward=True, backward=True):
+        """Rows of the relation between neighbors A and B, checked from
+        A's side if forward and from B's side if backward."""
+        rows = (self.rows_for(values_a, values_b) if forward
+                else [(1 << len(values_b)) - 1] * len(values_a))
+        if backward:
+            back = transpose(self.rows_for(values_b, values_a), len(values_a))
+            rows = [row & col for row, col in zip(rows, back)]
+        return rows
+
+
+class CompiledCSP(CSP):
+    """A CSP whose variables and values are mapped to dense integers.
+    Variable i stands for var_names[i], and value k of variable i for
+    val_names[i][k]. The structure is stored as:
+        masks       masks[i] is a bitset; bit k is set iff value k of
+                    variable i has not been ruled out.
+        sizes       sizes[i] is the number of bits set in masks[i].
+        trail       (i, old mask, old size) for every domain change, so a
+                    whole search level is undone by unwinding it.
+        nbr_start   CSR offsets: the arcs leaving i are the positions
+        nbr_index   e in range(nbr_start[i], nbr_start[i + 1]), and
+                    nbr_index[e] is the variable at the other end.
+        supports    supports[e][a] is the bitset of values of nbr_index[e]
+                    compatible with value a of the arc's source variable.
+    The neighbor graph is made symmetric, and the relation on each pair is
+    the conjunction of the original constraint checked from both sides, so
+    goal_test gives the same answer on both forms. Global constraints are
+    carried over on the variable indices; they compare values through
+    label(). Assignments map
+    variable indices to value indices; use decode/encode to translate."""
+
+    def __init__(self, csp):
+        var_names = list(csp.variables)
+        var_index = {var: i for i, var in enumerate(var_names)}
+        val_names = [list(csp.domains[var]) for var in var_names]
+        n = len(var_names)
+
+        adjacent = [set() for _ in range(n)]
+        for var in var_names:
+            for other in csp.neighbors.get(var, ()):
+                i, j = var_index[var], var_index[other]
+                adjacent[i].add(j)
+                adjacent[j].add(i)
+
+        nbr_start = array('i', [0])
+        nbr_index = array('i')
+        for i in range(n):
+            nbr_index.extend(sorted(adjacent[i]))
+            nbr_start.append(len(nbr_index))
+        arcs = {(i, nbr_index[e]): e
+                for i in range(n) for e in range(nbr_start[i], nbr_start[i + 1])}
+
+        CSP.__init__(self, list(range(n)),
+                     {i: list(range(len(val_names[i]))) for i in range(n)},
+                     {i: list(nbr_index[nbr_start[i]:nbr_start[i + 1]]) for i in range(n)},
+                     self.compatible,
+                     [g.rescope(var_index) for g in csp.global_constraints])
+        self.var_names = var_names
+        self.var_index = var_index
+        self.val_names = val_names
+        self.val_index = [{v: k for k, v in enumerate(vals)} for vals in val_names]
+        self.nbr_start = nbr_start
+        self.nbr_index = nbr_index
+        self.arcs = arcs
+        # Which way round each pair i < j was listed in csp.neighbors
+        self.directions = {(i, j): (var_names[j] in csp.neighbors.get(var_names[i], ()),
+                                    var_names[i] in csp.neighbors.get(var_names[j], ()))
+                           for (i, j) in arcs if i < j}
+        self.supports = self.arc_tables(csp.constraints)
+        self.masks = [(1 << len(vals)) - 1 for vals in val_names]
+        self.sizes = [len(vals) for vals in val_names]
+
+    def arc_tables(self, constraints):
+        """Build the supports of every arc from the constraint function
+        constraints, which is called on the original names."""
+        var_names, val_names = self.var_names, self.val_names
+        supports = [None] * len(self.nbr_index)
+        for (i, j), (forward, backward) in self.directions.items():
+            A, B = var_names[i], var_names[j]
+            if isinstance(constraints, TableConstraint):
+                rows = constraints.arc_rows(val_names[i], val_names[j], forward, backward)
+            else:
+                rows = [0] * len(val_names[i])
+                for a, va in enumerate(val_names[i]):
+                    for b, vb in enumerate(val_names[j]):
+                        if ((not forward or constraints(A, va, B, vb)) and
+                                (not backward or constraints(B, vb, A, va))):
+                            rows[a] |= 1 << b
+            supports[self.arcs[i, j]] = rows
+            supports[self.arcs[j, i]] = transpose(rows, len(val_names[j]))
+        return supports
+
+    def rechart(self, constraints):
+        """The same problem (variables, domains, neighbors and global
+        constraints) with the relations of another constraint function,
+        such as a TableConstraint over a different chart. The compiled
+        structure is shared; only the arc tables are built again, and the
+        copy starts with full domains and no search state."""
+        return self.derive(self.arc_tables(constraints), self.global_constraints)
+
+    def derive(self, supports, global_constraints):
+        """A copy sharing the compiled structure, with the arc tables
+        supports and the global constraints given (over variable indices),
+        full domains and no search state."""
+        other = copy.copy(self)
+        CSP.__init__(other, self.variables, self.domains, self.neighbors, other.compatible,
+                     [g.rescope({i: i for i in self.variables}) for g in global_constraints])
+        other.supports = supports
+        other.masks = [(1 << len(vals)) - 1 for vals in self.val_names]
+        other.sizes = [len(vals) for vals in self.val_names]
+        return other
+
+    def supported(self, Xi, Xj):
+        """The bitset of values of Xi with a support left in Xj."""
+        row = self.supports[self.arcs[Xi, Xj]]
+        other = self.masks[Xj]
+        keep = 0
+        for x in bits(self.masks[Xi]):
+            if row[x] & other:
+                keep |= 1 << x
+        return keep
+
+    def compatible(self, A, a, B, b):
+        """The constraint function: a single bit test on the arc's table."""
+        return self.supports[self.arcs[A, B]][a] >> b & 1 == 1
+
+    def nconflicts(self, var, val, assignment):
+        """Return the number of conflicts var=val has with other variables."""
+        if self.counter is not None and self.counter.knows(var, val, assignment):
+            return self.counter.nconflicts(var, val)
+        supports, nbr_index = self.supports, self.nbr_index
+        conflicts = 0
+        for e in range(self.nbr_start[var], self.nbr_start[var + 1]):
+            b = assignment.get(nbr_index[e])
+            if b is not None and not supports[e][val] >> b & 1:
+                conflicts += 1
+        for g in self.globals_of[var]:
+            conflicts += g.nconflicts(self, var, val, assignment)
+        return conflicts
+
+    def label(self, var, val):
+        return self.val_names[var][val]
+
+    def unlabel(self, var, label):
+        return self.val_index[var].get(label)
+
+    def display(self, assignment):
+        """Show a human-readable representation of the CSP."""
+        print('CSP with assignment:', self.decode(assignment))
+
+    def decode(self, assignment):
+        """Translate an assignment of indices back to the original names."""
+        if assignment is None:
+            return None
+        return {self.var_names[i]: self.val_names[i][k] for i, k in assignment.items()}
+
+    def encode(self, assignment):
+        """Translate an assignment of original names to indices."""
+        return {self.var_index[var]: self.val_index[self.var_index[var]][val]
+                for var, val in assignment.items()}
+
+    # Domains are always bitsets, so pruning needs no extra setup
+
+    def support_pruning(self):
+        pass
+
+    def suppose(self, var, value):
+        """Start accumulating inferences from assuming var=value."""
+        checkpoint = len(self.trail)
+        old = self.masks[var]
+        self.trail.append((var, old, self.sizes[var]))
+        self.masks[var] = 1 << value
+        self.sizes[var] = 1
+        for monitor in self.monitors:
+            for a in bits(old & ~(1 << value)):
+                monitor.on_prune(var, a)
+        return checkpoint
 
     def prune(self, var, value, removals):
         """Rule out var=value."""
-        self.curr_domains[var].remove(value)
-        if removals is not None:
-            removals.append((var, value))
+        self.trail.append((var, self.masks[var], self.sizes[var]))
+        self.masks[var] &= ~(1 << value)
+        self.sizes[var] -= 1
+        for monitor in self.monitors:
+            monitor.on_prune(var, value)
+
+    def retain(self, var, mask, removals):
+        """Rule out at once every value of var whose bit is not in mask.
+        Return the number of values removed."""
+        removed = self.masks[var] & ~mask
+        if not removed:
+            return 0
+        self.trail.append((var, self.masks[var], self.sizes[var]))
+        self.masks[var] ^= removed
+        lost = bin(removed).count('1')
+        self.sizes[var] -= lost
+        for monitor in self.monitors:
+            for b in bits(removed):
+                monitor.on_prune(var, b)
+        return lost
 
     def choices(self, var):
         """Return all values for var that aren't currently ruled out."""
-        return (self.curr_domains or self.domains)[var]
+        return list(bits(self.masks[var]))
+
+    def domain_size(self, var):
+        """Return the number of values still possible for var."""
+        return self.sizes[var]
 
     def restore(self, removals):
         """Undo a supposition and all inferences from it."""
-        for B, b in removals:
-            self.curr_domains[B].append(b)
+        trail, masks, sizes, monitors = self.trail, self.masks, self.sizes, self.monitors
+        while len(trail) > removals:
+            var, mask, size = trail.pop()
+            for monitor in monitors:
+                for b in bits(mask & ~masks[var]):
+                    monitor.on_restore(var, b)
+            masks[var] = mask
+            sizes[var] = size
+
+
+class MatrixCSP(CompiledCSP):
+    """A CompiledCSP that also holds the table of every arc as a numpy
+    boolean matrix, matrices[e][a, b] == supports[e][a] >> b & 1, and
+    finds supports with one matrix-vector product instead of a test per
+    value: for domains of hundreds of values, revise() then costs a pass
+    in C rather than one in Python. Domains stay bitsets, so everything
+    that works on a CompiledCSP works on it."""
+
+    def __init__(self, csp):
+        if numpy is None:
+            raise ImportError('MatrixCSP needs numpy')
+        CompiledCSP.__init__(self, csp)
+        self.matrices = self.arc_matrices(self.supports)
+
+    def arc_matrices(self, supports):
+        return [numpy.array([self.vector(row, len(self.val_names[self.nbr_index[e]]))
+                             for row in rows], dtype=bool).reshape(len(rows), -1)
+                for e, rows in enumerate(supports)]
+
+    def derive(self, supports, global_constraints):
+        other = CompiledCSP.derive(self, supports, global_constraints)
+        if supports is not self.supports:
+            other.matrices = other.arc_matrices(supports)
+        return other
+
+    @staticmethod
+    def vector(mask, width):
+        """The bitset mask as a boolean array of width entries."""
+        octets = numpy.frombuffer(mask.to_bytes((width + 7) // 8, 'little'), dtype=numpy.uint8)
+        return numpy.unpackbits(octets, bitorder='little')[:width].astype(bool)
+
+    @staticmethod
+    def bitset(vector):
+        """The boolean array vector as a bitset."""
+        return int.from_bytes(numpy.packbits(vector, bitorder='little').tobytes(), 'little')
+
+    def supported(self, Xi, Xj):
+        """The bitset of values of Xi with a support left in Xj."""
+        matrix = self.matrices[self.arcs[Xi, Xj]]
+        return self.bitset(matrix @ self.vector(self.masks[Xj], matrix.shape[1])) & self.masks[Xi]
+
+
+# ______________________________________________________________________________
+# Constraint Propagation with AC-3
+
+
+def AC3(csp, queue=None, removals=None, revise_fn=None):
+    """[Figure 6.3] Make every arc consistent, or return False on a wipeout.
+    Called with no queue it is a preprocessing pass over all arcs and its
+    prunings are permanent; mac() calls it with the arcs into the variable
+    just assigned, inside a supposition the search will restore. The arcs
+    run both ways between linked variables, even if only one side lists
+    the other as a neighbor (see revise)."""
+    revise_fn = revise_fn or revise
+    if queue is None:
+        queue = {(Xi, Xk) for Xi in csp.variables for Xk in csp.linked(Xi)}
+    csp.support_pruning()
+    while queue:
+        (Xi, Xj) = queue.pop()
+        if revise_fn(csp, Xi, Xj, removals):
+            if not csp.domain_size(Xi):
+                csp.bump_weight(Xi, Xj)
+                return False
+            for Xk in csp.linked(Xi):
+                if Xk != Xj:
+                    queue.add((Xk, Xi))
+    return True
+
+
+def revise(csp, Xi, Xj, removals):
+    """Return true if we remove a value. A value of Xj supports Xi=x if
+    the binary constraint holds from each side that lists the other as a
+    neighbor, as goal_test checks it."""
+    if isinstance(csp, CompiledCSP):
+        return revise_compiled(csp, Xi, Xj, removals)
+    supports = binary_check(csp, Xi, Xj)
+    if supports is None:
+        return False
+    revised = False
+    others = csp.choices(Xj)
+    for x in list(csp.choices(Xi)):
+        if not any(supports(x, y) for y in others):
+            csp.prune(Xi, x, removals)
+            revised = True
+    return revised
+
+
+def binary_check(csp, Xi, Xj):
+    """A function f(x, y) telling whether Xi=x and Xj=y satisfy the binary
+    constraint between them, checked from each side that lists the
+    other; None if neither does."""
+    forward, backward = Xj in csp.neighbors[Xi], Xi in csp.neighbors[Xj]
+    constraints = csp.constraints
+    if forward and backward:
+        return lambda x, y: constraints(Xi, x, Xj, y) and constraints(Xj, y, Xi, x)
+    if forward:
+        return lambda x, y: constraints(Xi, x, Xj, y)
+    if backward:
+        return lambda x, y: constraints(Xj, y, Xi, x)
+    return None
+
+
+def revise_compiled(csp, Xi, Xj, removals):
+    """revise() on a CompiledCSP: a value keeps its support iff its row of
+    the arc table intersects the bitset domain of Xj (see supported)."""
+    if (Xi, Xj) not in csp.arcs:
+        return False
+    return csp.retain(Xi, csp.supported(Xi, Xj), removals) > 0
+
+
+def AC3rm(csp, queue=None, removals=None):
+    """AC-3 with residual supports (AC-3rm, the backtracking-friendly
+    variant of AC-2001): see revise_rm."""
+    return AC3(csp, queue, removals, revise_rm)
+
+
+def revise_rm(csp, Xi, Xj, removals):
+    """Like revise, but remember in csp.residues the last support found for
+    each (Xi, x, Xj) and try it first next time. Residues are never undone
+    on backtracking; a stale one just costs a normal scan."""
+    if isinstance(csp, CompiledCSP):
+        # A bitset test already checks every candidate support at once
+        return revise_compiled(csp, Xi, Xj, removals)
+    supports = binary_check(csp, Xi, Xj)
+    if supports is None:
+        return False
+    residues = csp.residues
+    others = csp.choices(Xj)
+    present = set(others)
+    revised = False
+    for x in list(csp.choices(Xi)):
+        if (Xi, x, Xj) in residues and residues[Xi, x, Xj] in present:
+            continue
+        for y in others:
+            if supports(x, y):
+                residues[Xi, x, Xj] = y
+                break
+        else:
+            csp.prune(Xi, x, removals)
+            revised = True
+    return revised
+
+
+# ______________________________________________________________________________
+# Global constraints
+
+
+def propagate_globals(csp, removals, consistency=None):
+    """Run the filtering of every global constraint of csp until none of
+    them prunes anything, or return False on a wipeout. If consistency is
+    given (AC3 or AC3rm), the binary arcs into each variable a global
+    constraint pruned are revised before the next round."""
+    if not csp.global_constraints:
+        return True
+    while True:
+        changed = set()
+        for constraint in csp.global_constraints:
+            pruned = constraint.propagate(csp, removals)
+            if pruned is None:
+                return False
+            changed |= pruned
+        if not changed or consistency is None:
+            return True
+        if not consistency(csp, {(X, Y) for Y in changed for X in csp.linked(Y)},
+                           removals):
+            return False
+
+
+class AllDifferent:
+    """The variables in scope must all take different values.
+    propagate() does Regin's filtering: keep a maximum matching between
+    variables and values (repaired from the previous call, so deep in the
+    search it usually costs a few augmenting paths), then remove every
+    value that lies on no maximum matching, found from the strongly
+    connected components of the alternating graph. With bounds=True it
+    reasons on Hall intervals of ordered values instead, which needs no
+    matching or graph search but prunes less."""
+
+    def __init__(self, scope, bounds=False):
+        self.scope = list(scope)
+        self.bounds = bounds
+        self.matching = {}
+
+    def rescope(self, mapping):
+        """The same constraint over the variables mapping[var]."""
+        return AllDifferent([mapping[var] for var in self.scope], self.bounds)
+
+    def nconflicts(self, csp, var, val, assignment):
+        """Number of other variables in scope assigned the same value."""
+        label = csp.label(var, val)
+        return count(other != var and other in assignment and
+                     csp.label(other, assignment[other]) == label
+                     for other in self.scope)
+
+    def propagate(self, csp, removals):
+        """Prune unsupported values; return the set of variables pruned,
+        or None if the constraint cannot be satisfied."""
+        csp.support_pruning()
+        domains = {x: {csp.label(x, val) for val in csp.choices(x)} for x in self.scope}
+        if self.bounds:
+            doomed = self.hall_intervals(domains)
+        else:
+            doomed = self.regin(domains)
+        if doomed is None:
+            return None
+        pruned = set()
+        for x, labels in doomed.items():
+            for label in labels:
+                csp.prune(x, csp.unlabel(x, label), removals)
+            if labels:
+                pruned.add(x)
+                if not csp.domain_size(x):
+                    return None
+        return pruned
+
+    def regin(self, domains):
+        """Map each variable to the labels no maximum matching uses."""
+        match = {x: v for x, v in self.matching.items() if v in domains.get(x, ())}
+        owner = {v: x for x, v in match.items()}
+        for x in self.scope:
+            if x not in match and not self.augment(x, domains, match, owner):
+                self.matching = match
+                return None
+        self.matching = match
+
+        # Orient the matching edges variable -> value and the rest value -> variable
+        holders = defaultdict(list)
+        for x in self.scope:
+            for v in domains[x]:
+                holders[v].append(x)
+
+        def users(v):
+            return [x for x in holders[v] if match[x] != v]
+
+        # Edges on an alternating path from a free value may stay
+        reached = set(v for v in holders if v not in owner)
+        frontier = list(reached)
+        while frontier:
+            for x in users(frontier.pop()):
+                w = match[x]
+                if w not in reached:
+                    reached.add(w)
+                    frontier.append(w)
+        # and so may edges on an alternating cycle
+        component = strongly_connected(
+            [('x', x) for x in self.scope],
+            lambda node: ([('v', match[node[1]])] if node[0] == 'x' else
+                          [('x', x) for x in users(node[1])]))
+        return {x: [v for v in domains[x]
+                    if v != match[x] and v not in reached and
+                    component[('x', x)] != component.get(('v', v))]
+                for x in self.scope}
+
+    def augment(self, x, domains, match, owner):
+        """Extend the matching with a path from the free variable x."""
+        parent = {x: None}
+        frontier = [x]
+        while frontier:
+            y = frontier.pop()
+            for v in domains[y]:
+                z = owner.get(v)
+                if z is None:
+                    # Flip the alternating path ending at y
+                    while y is not None:
+                        previous = match.get(y)
+                        match[y], owner[v] = v, y
+                        v, y = previous, parent[y]
+                    return True
+                if z not in parent:
+                    parent[z] = y
+                    frontier.append(z)
+        return False
+
+    def hall_intervals(self, domains):
+        """Map each variable to the labels lying in a Hall interval (k
+        variables whose domains fit in k consecutive values) it is not part of."""
+        universe = sorted(set(v for labels in domains.values() for v in labels))
+        rank = {v: r for r, v in enumerate(universe)}
+        doomed = {x: [] for x in self.scope}
+        bounds = {x: (min(rank[v] for v in domains[x]), max(rank[v] for v in domains[x]))
+                  for x in self.scope if domains[x]}
+        if len(bounds) < len(self.scope):
+            return None
+        by_max = sorted(self.scope, key=lambda x: bounds[x][1])
+        for lo in sorted(set(low for low, _ in bounds.values())):
+            inside = 0
+            for x in by_max:
+                low, high = bounds[x]
+                if low < lo:
+                    continue
+                inside += 1
+                if inside > high - lo + 1:
+                    return None
+                if inside == high - lo + 1:
+                    for y in self.scope:
+                        if bounds[y][0] < lo or bounds[y][1] > high:
+                            doomed[y].extend(v for v in domains[y] if lo <= rank[v] <= high)
+        return {x: set(labels) for x, labels in doomed.items()}
+
+
+def strongly_connected(roots, successors):
+    """Tarjan's algorithm, iteratively: map every node reachable from roots
+    to the index of its strongly connected component."""
+    index, low, component = {}, {}, {}
+    stack, on_stack = [], set()
+    for root in roots:
+        if root in index:
+            continue
+        work = [(root, iter(successors(root)))]
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = low[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(successors(child))))
+                    break
+                elif child in on_stack:
+                    low[node] = min(low[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component[member] = index[node]
+                        if member == node:
+                            break
+    return component
+
+
+# ______________________________________________________________________________
+# Symmetries
+
+
+def value_ranks(csp):
+    """Rank every value of csp (as label() names it) by first appearance
+    in the domains, in the order of csp.variables."""
+    rank = {}
+    for var in csp.variables:
+        for val in csp.domains[var]:
+            rank.setdefault(csp.label(var, val), len(rank))
+    return rank
+
+
+class Increasing:
+    """The values of the variables in scope, ranked by rank, never
+    decrease along scope. It breaks the symmetry of interchangeable
+    variables."""
+
+    def __init__(self, scope, rank):
+        self.scope = list(scope)
+        self.rank = rank
+        self.position = {var: k for k, var in enumerate(self.scope)}
+
+    def rescope(self, mapping):
+        return Increasing([mapping[var] for var in self.scope], self.rank)
+
+    def nconflicts(self, csp, var, val, assignment):
+        """Number of assigned variables out of order with var=val."""
+        k, r = self.position[var], self.rank[csp.label(var, val)]
+
+        def out_of_order(other):
+            s = self.rank[csp.label(other, assignment[other])]
+            return s > r if self.position[other] < k else s < r
+
+        return count(other != var and other in assignment and out_of_order(other)
+                     for other in self.scope)
+
+    def propagate(self, csp, removals):
+        """Bound each variable by the least rank possible before it and the
+        greatest possible after it; return the variables pruned, or None on
+        a wipeout."""
+        pruned = set()
+        for scope, keep in ((self.scope, operator.ge), (self.scope[::-1], operator.le)):
+            bound = None
+            for X in scope:
+                for val in csp.choices(X):
+                    if bound is not None and not keep(self.rank[csp.label(X, val)], bound):
+                        csp.prune(X, val, removals)
+                        pruned.add(X)
+                if not csp.domain_size(X):
+                    return None
+                ranks = [self.rank[csp.label(X, val)] for val in csp.choices(X)]
+                bound = min(ranks) if keep is operator.ge else max(ranks)
+        return pruned
+
+
+class ValuePrecedence:
+    """Along scope, each of the interchangeable values (ordered by rank)
+    may only be taken after the one before it has been: it breaks the
+    symmetry of values that can be swapped throughout a solution."""
+
+    def __init__(self, scope, values):
+        self.scope = list(scope)
+        self.values = list(values)
+        self.follows = dict(zip(self.values[1:], self.values))
+
+    def rescope(self, mapping):
+        return ValuePrecedence([mapping[var] for var in self.scope], self.values)
+
+    def nconflicts(self, csp, var, val, assignment):
+        """1 if the assigned start of scope, with var=val, takes a value
+        before the one it follows, else 0."""
+        seen = set()
+        for X in self.scope:
+            if X == var:
+                label = csp.label(var, val)
+            elif X in assignment:
+                label = csp.label(X, assignment[X])
+            else:
+                break
+            if label in self.follows and self.follows[label] not in seen:
+                return 1
+            seen.add(label)
+        return 0
+
+    def propagate(self, csp, removals):
+        """Remove each value from the variables up to, and including, the
+        first one that can still take the value before it; return the
+        variables pruned, or None on a wipeout."""
+        pruned = set()
+        for previous, label in zip(self.values, self.values[1:]):
+            for X in self.scope:
+                values = csp.choices(X)
+                val = csp.unlabel(X, label)
+                if val is not None and val in values:
+                    csp.prune(X, val, removals)
+                    pruned.add(X)
+                    if not csp.domain_size(X):
+                        return None
+                if csp.unlabel(X, previous) in values:
+                    break
+        return pruned
+
+
+def interchangeable(candidates, symmetric):
+    """Partition candidates into classes of pairwise interchangeable
+    elements, testing each against the first member of every class so far
+    (transpositions that are symmetries compose into one class)."""
+    classes = []
+    for x in candidates:
+        for members in classes:
+            if symmetric(members[0], x):
+                members.append(x)
+                break
+        else:
+            classes.append([x])
+    return [members for members in classes if len(members) > 1]
+
+
+def variable_symmetries(csp):
+    """Classes of interchangeable variables of a CompiledCSP: swapping two
+    of them maps the problem onto itself, because they have the same
+    values, the same other neighbors with the same arc tables, a symmetric
+    table between them, and the same AllDifferent constraints."""
+    scoped = {var for g in csp.global_constraints
+              if not isinstance(g, AllDifferent) for var in g.scope}
+    neighbors = [set(csp.neighbors[i]) for i in csp.variables]
+
+    def symmetric(i, j):
+        if csp.val_names[i] != csp.val_names[j] or neighbors[i] - {j} != neighbors[j] - {i}:
+            return False
+        if j in neighbors[i] and csp.supports[csp.arcs[i, j]] != csp.supports[csp.arcs[j, i]]:
+            return False
+        if any((i in g.scope) != (j in g.scope) for g in csp.global_constraints):
+            return False
+        return all(csp.supports[csp.arcs[i, k]] == csp.supports[csp.arcs[j, k]]
+                   for k in neighbors[i] - {j})
+
+    return interchangeable([i for i in csp.variables if i not in scoped], symmetric)
+
+
+def value_symmetries(csp):
+    """Classes of interchangeable values of a CompiledCSP, by name: swapping
+    two of them in every domain at once maps the problem onto itself,
+    because they belong to the same variables and every arc table is
+    unchanged when they are swapped at both ends. Only AllDifferent is
+    known to be indifferent to that, so other global constraints rule
+    value symmetries out."""
+    if not all(isinstance(g, AllDifferent) for g in csp.global_constraints):
+        return []
+    rank = value_ranks(csp)
+    holders = defaultdict(set)
+    for i in csp.variables:
+        for label in csp.val_names[i]:
+            holders[label].add(i)
+
+    def swap_bits(row, c, d):
+        """row with bits c and d exchanged."""
+        if (row >> c ^ row >> d) & 1:
+            row ^= 1 << c | 1 << d
+        return row
+
+    def symmetric(p, q):
+        if holders[p] != holders[q]:
+            return False
+        for i in holders[p]:
+            a, b = csp.val_index[i][p], csp.val_index[i][q]
+            for e in range(csp.nbr_start[i], csp.nbr_start[i + 1]):
+                j, rows = csp.nbr_index[e], csp.supports[e]
+                c, d = csp.val_index[j].get(p), csp.val_index[j].get(q)
+                for x, row in enumerate(rows):
+                    y = b if x == a else a if x == b else x
+                    if c is not None:
+                        row = swap_bits(row, c, d)
+                    if row != rows[y]:
+                        return False
+        return True
+
+    return interchangeable(sorted(holders, key=rank.get), symmetric)
+
+
+def break_symmetries(csp):
+    """Return csp compiled afresh with symmetry-breaking constraints added:
+    Increasing over each class of interchangeable variables (in the order
+    of csp.variables) and ValuePrecedence over each class of
+    interchangeable values (along all the variables), both by the value
+    ranks of value_ranks(). Both keep the lexicographically least solution
+    of every class of symmetric ones, so together they still keep one,
+    and search (enumeration above all, and proofs that there is no
+    solution) skips the symmetric copies of every subtree."""
+    compiled = csp if isinstance(csp, CompiledCSP) else csp.compile()
+    rank = value_ranks(compiled)
+    extra = ([Increasing(members, rank) for members in variable_symmetries(compiled)] +
+             [ValuePrecedence(compiled.variables, values)
+              for values in value_symmetries(compiled)])
+    return compiled.derive(compiled.supports, list(compiled.global_constraints) + extra)
 
 
 # ______________________________________________________________________________
@@ -126,6 +1151,149 @@ def first_unassigned_variable(assignment, csp):
     """The default variable order."""
     return first([var for var in csp.variables if var not in assignment])
 
+
+def mrv(assignment, csp):
+    """Minimum-remaining-values heuristic."""
+    return argmin_random_tie(
+        [v for v in csp.variables if v not in assignment],
+        key=lambda var: num_legal_values(csp, var, assignment))
+
+
+def num_legal_values(csp, var, assignment):
+    if csp.curr_domains or isinstance(csp, CompiledCSP):
+        return csp.domain_size(var)
+    else:
+        return count(csp.nconflicts(var, val, assignment) == 0
+                     for val in csp.domains[var])
+
+
+class VariableOrdering(Monitor):
+    """A select_unassigned_variable that keeps the unassigned variables in
+    a heap ordered by key(var), smallest first with ties broken at random.
+    It registers as a monitor of the CSP, so every assignment and domain
+    change re-keys only the variables it touches, and choosing the next
+    variable costs O(log n) amortized instead of a scan of csp.variables.
+    Keys come from pruned domains, so pair it with an inference such as
+    forward_checking or mac. Call detach() once the search is over."""
+
+    def __init__(self, csp):
+        self.csp = csp
+        self.assigned = set()
+        self.version = dict.fromkeys(csp.variables, 0)
+        self.dirty = set()
+        self.heap = []
+        self.setup()
+        self.rebuild()
+        self.attach(csp)
+
+    def setup(self):
+        """Initialize the bookkeeping key() depends on."""
+
+    def key(self, var):
+        raise NotImplementedError
+
+    def rebuild(self):
+        self.heap = [(self.key(var), random.random(), self.version[var], var)
+                     for var in self.csp.variables if var not in self.assigned]
+        heapq.heapify(self.heap)
+        self.dirty.clear()
+
+    def touch(self, var):
+        """Note that key(var) may have changed."""
+        self.version[var] += 1
+        self.dirty.add(var)
+
+    def __call__(self, assignment, csp):
+        heap, version = self.heap, self.version
+        for var in self.dirty:
+            if var not in self.assigned:
+                heapq.heappush(heap, (self.key(var), random.random(), version[var], var))
+        self.dirty.clear()
+        if len(heap) > 4 * len(version) + 64:
+            self.rebuild()
+            heap = self.heap
+        while heap:
+            _, _, stamp, var = heap[0]
+            if var in assignment or stamp != version[var]:
+                heapq.heappop(heap)
+            else:
+                return var
+        return first_unassigned_variable(assignment, csp)
+
+    def on_assign(self, var, val):
+        if var not in self.assigned:
+            self.assigned.add(var)
+            self.version[var] += 1
+            self.neighbor_assigned(var, -1)
+
+    def on_unassign(self, var):
+        if var in self.assigned:
+            self.assigned.remove(var)
+            self.touch(var)
+            self.neighbor_assigned(var, +1)
+
+    def neighbor_assigned(self, var, sign):
+        """Update the keys of var's neighbors after var was assigned
+        (sign -1) or unassigned (sign +1)."""
+
+    def on_prune(self, var, val):
+        if var not in self.assigned:
+            self.touch(var)
+
+    on_restore = on_prune
+
+
+class MRVOrdering(VariableOrdering):
+    """Minimum remaining values; ties go to the variable constraining the
+    most unassigned variables (the degree heuristic) unless degree=False."""
+
+    def __init__(self, csp, degree=True):
+        self.use_degree = degree
+        VariableOrdering.__init__(self, csp)
+
+    def setup(self):
+        self.degree = {var: len(self.csp.neighbors[var]) for var in self.csp.variables}
+
+    def key(self, var):
+        if self.use_degree:
+            return (self.csp.domain_size(var), -self.degree[var])
+        return self.csp.domain_size(var)
+
+    def neighbor_assigned(self, var, sign):
+        if self.use_degree:
+            for Y in self.csp.neighbors[var]:
+                self.degree[Y] += sign
+                if Y not in self.assigned:
+                    self.touch(Y)
+
+
+class DomWdegOrdering(VariableOrdering):
+    """dom/wdeg: domain size over the summed weights of the constraints
+    linking a variable to unassigned ones. csp.bump_weight (called by the
+    inferences on every wipeout) makes failing constraints weigh more."""
+
+    def setup(self):
+        csp = self.csp
+        self.wdeg = {var: sum(csp.weight(var, Y) for Y in csp.neighbors[var])
+                     for var in csp.variables}
+
+    def key(self, var):
+        wdeg = self.wdeg[var]
+        return self.csp.domain_size(var) / wdeg if wdeg > 0 else search.infinity
+
+    def neighbor_assigned(self, var, sign):
+        for Y in self.csp.neighbors[var]:
+            self.wdeg[Y] += sign * self.csp.weight(var, Y)
+            if Y not in self.assigned:
+                self.touch(Y)
+
+    def on_weight(self, A, B):
+        for X, Y in ((A, B), (B, A)):
+            if X in self.wdeg and Y not in self.assigned:
+                self.wdeg[X] += 1
+                if X not in self.assigned:
+                    self.touch(X)
+
 # Value ordering
 
 
@@ -134,75 +1302,1626 @@ def unordered_domain_values(var, assignment, csp):
     return csp.choices(var)
 
 
+def shuffled_domain_values(var, assignment, csp):
+    """The values in random order, so that restarts try new branches."""
+    values = list(csp.choices(var))
+    random.shuffle(values)
+    return values
+
+
+class LCVOrdering:
+    """An order_domain_values that tries least-constraining values first:
+    those with the most supports left in the current domains of their
+    unassigned neighbors. The counts are taken for the chosen variable
+    only, when it is ordered. On a CompiledCSP each is a popcount of the
+    arc's row against the neighbor's domain. On a plain CSP each costs a
+    constraint check per neighbor value, d*d*deg checks per node, which
+    is more than sorting by nconflicts; compile() the problem first."""
+
+    def __init__(self, csp):
+        csp.support_pruning()
+        self.csp = csp
+
+    def count(self, X, a, Y):
+        """Number of values left for Y compatible with X=a."""
+        csp = self.csp
+        if isinstance(csp, CompiledCSP):
+            return bin(csp.supports[csp.arcs[X, Y]][a] & csp.masks[Y]).count('1')
+        return count(csp.constraints(X, a, Y, b) for b in csp.choices(Y))
+
+    def __call__(self, var, assignment, csp):
+        open_neighbors = [Y for Y in csp.neighbors[var] if Y not in assignment]
+        supports = {a: sum(self.count(var, a, Y) for Y in open_neighbors)
+                    for a in csp.choices(var)}
+        return sorted(supports, key=lambda val: -supports[val])
+
+
 # Inference
 def no_inference(csp, var, value, assignment, removals):
     return True
 
+
+def forward_checking(csp, var, value, assignment, removals):
+    """Prune neighbor values inconsistent with var=value."""
+    if isinstance(csp, CompiledCSP):
+        return forward_checking_compiled(csp, var, value, assignment, removals)
+    csp.support_pruning()
+    for B in csp.neighbors[var]:
+        if B not in assignment:
+            for b in list(csp.choices(B)):
+                if not csp.constraints(var, value, B, b):
+                    csp.prune(B, b, removals)
+            if not csp.domain_size(B):
+                csp.bump_weight(var, B)
+                return False
+    return not csp.globals_of[var] or propagate_globals(csp, removals)
+
+
+def forward_checking_compiled(csp, var, value, assignment, removals):
+    """forward_checking() on a CompiledCSP: each neighbor's domain is
+    intersected with the row of var=value, and the kept size counter
+    tells a wipeout without looking at the domain again."""
+    supports, nbr_index, sizes = csp.supports, csp.nbr_index, csp.sizes
+    for e in range(csp.nbr_start[var], csp.nbr_start[var + 1]):
+        B = nbr_index[e]
+        if B not in assignment:
+            csp.retain(B, supports[e][value], removals)
+            if not sizes[B]:
+                csp.bump_weight(var, B)
+                return False
+    return not csp.globals_of[var] or propagate_globals(csp, removals)
+
+
+def mac(csp, var, value, assignment, removals):
+    """Maintain arc consistency. Each pair is checked from every side that
+    lists the other, so one-sided neighbor lists are kept as goal_test
+    reads them:
+    >>> chart = TableConstraint({'a': ['b'], 'b': []})
+    >>> problem = CSP([0, 1], {0: 'ab', 1: 'ab'}, {0: [], 1: [0]}, chart)
+    >>> backtracking_search(problem, inference=mac)
+    {0: 'b', 1: 'a'}
+    """
+    return (AC3(csp, {(X, var) for X in csp.linked(var)}, removals) and
+            propagate_globals(csp, removals, AC3))
+
+
+def mac_rm(csp, var, value, assignment, removals):
+    """Maintain arc consistency with AC-3rm and its residual supports."""
+    return (AC3rm(csp, {(X, var) for X in csp.linked(var)}, removals) and
+            propagate_globals(csp, removals, AC3rm))
+
 # The search, proper
 
 
 def backtracking_search(csp,
                         select_unassigned_variable=first_unassigned_variable,
                         order_domain_values=unordered_domain_values,
-                        inference=no_inference):
-    """[Figure 6.5]"""
+                        inference=no_inference,
+                        monitors=(),
+                        backjumping=False,
+                        nogoods=None,
+                        restarts=None):
+    """[Figure 6.5]
+    monitors are attached to csp for the duration of the search (see
+    Monitor); with none attached, tracing costs nothing.
+    With backjumping=True a dead end jumps straight back to the most recent
+    variable in its conflict set (conflict-directed backjumping, FC-CBJ
+    when inference is forward_checking). Conflict sets are exact only with
+    no_inference or forward_checking and no global constraints; otherwise
+    they hold every earlier variable and the search stays chronological.
+    nogoods is a NogoodStore: each conflict set found is learned as a
+    nogood and checked before trying a value. It implies backjumping.
+    restarts is a schedule of budgets, such as luby() or geometric(): a
+    run that meets more dead ends than its budget is undone and the search
+    starts over with the next one, unbounded once the schedule runs out.
+    What was learned carries over (the constraint weights dom/wdeg feeds
+    on, the nogoods), and a randomized order (the ties of mrv and of a
+    VariableOrdering, shuffled_domain_values) makes each run different."""
     def backtrack(assignment):
         if len(assignment) == len(csp.variables):
             return assignment
         var = select_unassigned_variable(assignment, csp)
 
         for value in order_domain_values(var, assignment, csp):
-            print("Value = ", value)
             if 0 == csp.nconflicts(var, value, assignment):
                 csp.assign(var, value, assignment)
                 #gui.circle_assigment(int(var),value)
                 removals = csp.suppose(var, value)
-                update_domain(csp,assignment)
                 if inference(csp, var, value, assignment, removals):
                     #gui.wait()
-                    inpt = input()
                     result = backtrack(assignment)
                     if result is not None:
                         return result
                 csp.restore(removals)
         csp.unassign(var, assignment)
+        dead_end(var)
         #gui.circle_unassigment(int(var))
         #gui.wait()
         return None
 
-    result = backtrack({})
-    assert result is None or csp.goal_test(result)
+    levels = []    # (trail checkpoint, variable) of every decision on the path
+    exact = inference in (no_inference, forward_checking) and not csp.global_constraints
+
+    def pruners(Y):
+        """The decision variables whose levels pruned Y's domain."""
+        starts = [start for start, _ in levels]
+        found = set()
+        for t in range(starts[0] if starts else 0, len(csp.trail)):
+            if csp.trail[t][0] == Y:
+                found.add(levels[bisect.bisect_right(starts, t) - 1][1])
+        return found
+
+    def blame(var, value, assignment):
+        """The assigned variables that rule out var=value."""
+        culprits = {Y for Y in csp.neighbors[var]
+                    if Y in assignment and not csp.constraints(var, value, Y, assignment[Y])}
+        if csp.globals_of[var] and csp.nconflicts(var, value, assignment) > len(culprits):
+            culprits.update(assignment)
+        if nogoods is not None:
+            nogood = nogoods.blocking(var, value, assignment)
+            if nogood is not None:
+                culprits.update(Y for Y, _ in nogood if Y != var)
+        return culprits
+
+    def backjump(assignment):
+        """Like backtrack, but return (solution, None) or (None, conflict set)."""
+        if len(assignment) == len(csp.variables):
+            return assignment, None
+        var = select_unassigned_variable(assignment, csp)
+        conflict = set()
+        for value in order_domain_values(var, assignment, csp):
+            culprits = blame(var, value, assignment)
+            if culprits:
+                conflict |= culprits
+                continue
+            csp.assign(var, value, assignment)
+            removals = csp.suppose(var, value)
+            levels.append((removals, var))
+            if inference(csp, var, value, assignment, removals):
+                result, jump = backjump(assignment)
+                if result is not None:
+                    return result, None
+                if var not in jump:
+                    levels.pop()
+                    csp.restore(removals)
+                    csp.unassign(var, assignment)
+                    return None, jump
+                conflict |= jump
+            elif exact:
+                wiped = first(Y for Y in csp.neighbors[var]
+                              if Y not in assignment and not csp.domain_size(Y))
+                if wiped is not None:
+                    conflict |= pruners(wiped)
+            levels.pop()
+            csp.restore(removals)
+        csp.unassign(var, assignment)
+        if exact:
+            conflict |= pruners(var)
+            conflict.discard(var)
+            if nogoods is not None and conflict:
+                nogoods.add((Y, assignment[Y]) for Y in conflict)
+        else:
+            conflict = set(assignment)
+        dead_end(var)
+        return None, conflict
+
+    fails, budget = 0, None
+
+    def dead_end(var):
+        """Report that var ran out of values; give up the run if that
+        exceeds its budget."""
+        nonlocal fails
+        for monitor in csp.monitors:
+            monitor.on_backtrack(var)
+        fails += 1
+        if budget is not None and fails > budget:
+            raise Restart
+
+    for monitor in monitors:
+        monitor.attach(csp)
+    schedule = iter(restarts or ())
+    start = len(csp.trail)
+    try:
+        while True:
+            fails, budget = 0, next(schedule, None)
+            assignment = {}
+            try:
+                if backjumping or nogoods is not None:
+                    result = backjump(assignment)[0]
+                else:
+                    result = backtrack(assignment)
+                break
+            except Restart:
+                for var in list(assignment):
+                    csp.unassign(var, assignment)
+                csp.restore(start)
+                del levels[:]
+                for monitor in csp.monitors:
+                    monitor.on_restart()
+        assert result is None or csp.goal_test(result)
+        if result is not None:
+            for monitor in csp.monitors:
+                monitor.on_solution(result)
+    finally:
+        for monitor in monitors:
+            monitor.detach()
+    return result
+
+
+class Restart(Exception):
+    """Raised inside backtracking_search to abandon a run."""
+
+
+def luby(unit=100):
+    """Generate unit times the Luby sequence 1, 1, 2, 1, 1, 2, 4, 1, 1, 2,
+    ...: restarting on this schedule is within a log factor of the best
+    fixed budget, whatever the distribution of run lengths."""
+    for i in itertools.count(1):
+        while i != (1 << i.bit_length()) - 1:
+            i -= (1 << (i.bit_length() - 1)) - 1
+        yield unit << (i.bit_length() - 1)
+
+
+def geometric(unit=100, factor=1.5):
+    """Generate budgets unit, unit*factor, unit*factor^2, ..."""
+    budget = unit
+    while True:
+        yield int(budget)
+        budget *= factor
+
+
+def iter_solutions(csp,
+                   select_unassigned_variable=first_unassigned_variable,
+                   order_domain_values=unordered_domain_values,
+                   inference=no_inference,
+                   monitors=(),
+                   limit=None):
+    """Generate every solution of csp, or the first limit of them, in the
+    order backtracking_search would find them. The search resumes where it
+    left off after each one, and each solution is a read-only snapshot
+    (a MappingProxyType over a copy of the assignment), so nothing is kept
+    between solutions. Closing the generator early, or exhausting it,
+    leaves csp as it was."""
+    def backtrack(assignment):
+        if len(assignment) == len(csp.variables):
+            yield MappingProxyType(dict(assignment))
+            return
+        var = select_unassigned_variable(assignment, csp)
+        for value in order_domain_values(var, assignment, csp):
+            if 0 == csp.nconflicts(var, value, assignment):
+                csp.assign(var, value, assignment)
+                removals = csp.suppose(var, value)
+                if inference(csp, var, value, assignment, removals):
+                    yield from backtrack(assignment)
+                csp.restore(removals)
+        csp.unassign(var, assignment)
+        for monitor in csp.monitors:
+            monitor.on_backtrack(var)
+
+    csp.support_pruning()
+    start = len(csp.trail)
+    assignment = {}
+    solutions = backtrack(assignment)
+    for monitor in monitors:
+        monitor.attach(csp)
+    try:
+        for solution in itertools.islice(solutions, limit):
+            for monitor in csp.monitors:
+                monitor.on_solution(solution)
+            yield solution
+    finally:
+        solutions.close()
+        for var in list(assignment):
+            csp.unassign(var, assignment)
+        csp.restore(start)
+        for monitor in monitors:
+            monitor.detach()
+
+
+def count_solutions(csp, inference=forward_checking, cache=None):
+    """Return the number of solutions of csp without listing them.
+    Once some variables are assigned, what is left to count is the
+    unassigned variables, with the values inference left them that have
+    no conflict with the assignment (checked from both sides, as
+    goal_test does, whatever inference pruned). That residual problem splits into
+    the connected components of the constraint graph (global constraints
+    link their whole scope), whose counts multiply, and each component's
+    count is cached under its variables, their domains and the values of
+    the assigned variables linked to it, so a residual problem met again
+    down another branch is not counted twice. Pass a dict as cache to
+    share it between calls on the same problem."""
+    csp.support_pruning()
+    order = {var: i for i, var in enumerate(csp.variables)}
+    links = constraint_graph(csp)
+    listed_by = {var: [] for var in csp.variables}
+    for X in csp.variables:
+        for Y in csp.neighbors[X]:
+            listed_by[Y].append(X)
+    cache = {} if cache is None else cache
+    assignment = {}
+
+    def consistent(var, value):
+        return (csp.nconflicts(var, value, assignment) == 0 and
+                all(csp.constraints(Y, assignment[Y], var, value)
+                    for Y in listed_by[var] if Y in assignment))
+
+    if isinstance(csp, CompiledCSP):
+        def domain_key(var):
+            return csp.masks[var]
+    else:
+        def domain_key(var):
+            return frozenset(csp.curr_domains[var])
+
+    def components(variables):
+        """Split the unassigned variables into connected components."""
+        left = set(variables)
+        while left:
+            root = left.pop()
+            part, frontier = [root], [root]
+            while frontier:
+                for Y in links[frontier.pop()]:
+                    if Y in left:
+                        left.remove(Y)
+                        part.append(Y)
+                        frontier.append(Y)
+            yield sorted(part, key=order.get)
+
+    def count_component(part):
+        boundary = {Y for X in part for Y in links[X] if Y in assignment}
+        key = (tuple((var, domain_key(var)) for var in part),
+               tuple((Y, assignment[Y]) for Y in sorted(boundary, key=order.get)))
+        if key in cache:
+            return cache[key]
+        if len(part) == 1:
+            var = part[0]
+            total = count(consistent(var, value) for value in csp.choices(var))
+        else:
+            var = min(part, key=csp.domain_size)
+            rest = [v for v in part if v != var]
+            total = 0
+            for value in csp.choices(var):
+                if not consistent(var, value):
+                    continue
+                csp.assign(var, value, assignment)
+                removals = csp.suppose(var, value)
+                if inference(csp, var, value, assignment, removals):
+                    product = 1
+                    for component in components(rest):
+                        product *= count_component(component)
+                        if not product:
+                            break
+                    total += product
+                csp.restore(removals)
+            csp.unassign(var, assignment)
+        cache[key] = total
+        return total
+
+    total = 1
+    for component in components(csp.variables):
+        total *= count_component(component)
+        if not total:
+            break
+    return total
+
+
+class NogoodStore:
+    """Nogoods learned by backjumping: sets of (var, value) pairs that
+    cannot all hold in a solution. They follow from the constraints alone,
+    so a store can be reused by later searches on the same problem. Each
+    nogood is indexed by its pairs, and counts the branches it has cut;
+    when the store grows past limit, the least useful half is dropped and
+    the counts of the rest are halved, so old merits fade."""
+
+    def __init__(self, limit=1000):
+        self.limit = limit
+        self.hits = {}
+        self.watch = defaultdict(list)
+
+    def __len__(self):
+        return len(self.hits)
+
+    def add(self, nogood):
+        nogood = frozenset(nogood)
+        if nogood in self.hits:
+            return
+        self.hits[nogood] = 0
+        for pair in nogood:
+            self.watch[pair].append(nogood)
+        if len(self.hits) > self.limit:
+            self.evict()
+
+    def evict(self):
+        ranked = sorted(enumerate(self.hits), reverse=True,
+                        key=lambda item: (self.hits[item[1]], item[0]))
+        keep = [nogood for _, nogood in ranked[:self.limit // 2]]
+        self.hits = {nogood: self.hits[nogood] // 2 for nogood in keep}
+        self.watch = defaultdict(list)
+        for nogood in keep:
+            for pair in nogood:
+                self.watch[pair].append(nogood)
+
+    def blocking(self, var, value, assignment):
+        """Return a nogood that var=value would complete, or None."""
+        for nogood in self.watch.get((var, value), ()):
+            if all(Y == var or (Y in assignment and assignment[Y] == y) for Y, y in nogood):
+                self.hits[nogood] += 1
+                return nogood
+        return None
+
+
+class DomainReport(Monitor):
+    """A human-readable trace of the search. After every assignment it
+    writes the assignment and, for each variable, the values still
+    consistent with it. Building this costs O(n*d*deg) per node, which is
+    why it is a monitor: attach it only when somebody reads the output."""
+
+    def __init__(self, write=print):
+        self.write = write
+        self.assignment = {}
+        self.nodes = 0
+
+    def on_assign(self, var, val):
+        self.assignment[var] = val
+        self.nodes += 1
+        self.report()
+
+    def on_unassign(self, var):
+        self.assignment.pop(var, None)
+
+    def on_backtrack(self, var):
+        self.write('Backtrack from {}'.format(var))
+
+    def on_solution(self, assignment):
+        self.write('Solution: {}'.format(assignment))
+
+    def report(self):
+        self.write('CSP with assignment: {}'.format(self.assignment))
+        assignment = self.current()
+        for Xi in self.csp.variables:
+            self.write('{} -> {}'.format(Xi, self.csp.actions2(Xi, assignment)))
+
+    def current(self):
+        """The assignment so far. When the CSP counts conflicts for an
+        equal one, that is returned instead, so actions2 on it is cheap."""
+        counter = self.csp.counter
+        if counter is not None and counter.current == self.assignment:
+            return counter.source
+        return self.assignment
+
+
+# ______________________________________________________________________________
+# Parallel portfolio of backtracking searches
+
+
+# Each entry holds keyword arguments for backtracking_search. An ordering
+# given as a class is instantiated on the worker's own copy of the CSP,
+# and 'seed' seeds the random tie-breaking of that run.
+portfolio = [
+    dict(select_unassigned_variable=DomWdegOrdering, inference=mac, seed=0),
+    dict(select_unassigned_variable=MRVOrdering, order_domain_values=LCVOrdering,
+         inference=forward_checking, seed=1),
+    dict(select_unassigned_variable=mrv, inference=mac_rm, seed=2),
+    dict(select_unassigned_variable=DomWdegOrdering, inference=forward_checking,
+         backjumping=True, seed=3),
+]
+
+
+def portfolio_search(csp, configs=None, workers=None):
+    """Race differently configured backtracking_search runs on csp, one
+    per configuration (default: portfolio), in a pool of worker processes
+    (default: one per CPU). Every run is complete, so the first to finish
+    decides: its result is returned (a solution, or None when the problem
+    has none) and the pool is terminated, killing the runs still going.
+    csp and the configurations must be picklable, so the constraint
+    function has to be defined at module level."""
+    configs = list(configs or portfolio)
+    workers = min(workers or os.cpu_count() or 1, len(configs))
+    with multiprocessing.Pool(workers, pool_worker, (csp,)) as pool:
+        for result in pool.imap_unordered(portfolio_run, configs):
+            return result
+
+
+def pool_worker(csp, config=None):
+    """Pool initializer: keep the problem (and configuration) sent once
+    to this worker."""
+    global worker_csp, worker_config
+    worker_csp, worker_config = csp, config
+
+
+def portfolio_run(config):
+    """Run one configuration of portfolio_search on a fresh copy of the
+    worker's problem."""
+    return configured_search(copy.deepcopy(worker_csp), config)
+
+
+def configured_search(csp, config):
+    """Run backtracking_search on csp with the keyword arguments in
+    config, read as the entries of portfolio are."""
+    config = dict(config)
+    if 'seed' in config:
+        random.seed(config.pop('seed'))
+    made = []
+    for key in ('select_unassigned_variable', 'order_domain_values'):
+        if isinstance(config.get(key), type):
+            config[key] = config[key](csp)
+            if isinstance(config[key], Monitor):
+                made.append(config[key])
+    try:
+        return backtracking_search(csp, **config)
+    finally:
+        for ordering in made:
+            ordering.detach()
+
+
+# ______________________________________________________________________________
+# Batches of problems that differ only in their charts
+
+
+def batch_search(csp, charts, workers=None, chunksize=1, **config):
+    """Solve, for each constraint function in charts (typically a
+    TableConstraint), the problem with the variables, domains, neighbors
+    and global constraints of csp but the relations of that function.
+    csp is compiled once, and each instance only builds its arc tables
+    (see CompiledCSP.rechart) before backtracking_search runs on it with
+    the keyword arguments config, read as the entries of portfolio are.
+    The instances are spread over a pool of worker processes (default:
+    one per CPU; with workers=1 they run here, in turn) that get the
+    compiled problem once. Generate (i, solution) for the i-th chart as
+    soon as it is solved, with the solution in the original names, or
+    None; so the results come in order of completion. charts may be any
+    iterable, consumed as the workers need it; csp, the charts and config
+    must be picklable."""
+    template = csp if isinstance(csp, CompiledCSP) else csp.compile()
+    if workers == 1:
+        pool_worker(template, config)
+        yield from map(batch_run, enumerate(charts))
+        return
+    with multiprocessing.Pool(workers or os.cpu_count(), pool_worker, (template, config)) as pool:
+        yield from pool.imap_unordered(batch_run, enumerate(charts), chunksize)
+
+
+def batch_run(task):
+    """Solve one instance of batch_search in the worker."""
+    i, chart = task
+    csp = worker_csp.rechart(chart)
+    return i, csp.decode(configured_search(csp, worker_config))
+
+
+# ______________________________________________________________________________
+# Parallel enumeration with work stealing
+
+
+def parallel_solutions(csp, workers=None, inference=forward_checking):
+    """Generate every solution of csp, searched by a team of worker
+    processes (default: one per CPU), in whatever order they are found.
+    The whole tree starts as one task; a worker that runs dry asks for
+    work, and the first busy worker to notice hands over half of the
+    untried values at its shallowest open level, each as a task of its
+    own (the decisions leading there plus one more). Big subtrees are so
+    split near the root, where they are big, and only when a core would
+    otherwise sit idle. csp and inference must be picklable."""
+    yield from work_stealing(csp, workers, inference, False)
+
+
+def parallel_count(csp, workers=None, inference=forward_checking):
+    """Return the number of solutions of csp, enumerated as in
+    parallel_solutions() but only counted, in the workers."""
+    return sum(work_stealing(csp, workers, inference, True))
+
+
+def work_stealing(csp, workers, inference, counting):
+    """Run the workers of parallel_solutions() and dispatch their tasks.
+    Generate the solutions, or when counting, the count of each task."""
+    workers = workers or os.cpu_count() or 1
+    results = multiprocessing.Queue()
+    hungry = multiprocessing.Value('i', 0)
+    inboxes = [multiprocessing.Queue() for _ in range(workers)]
+    team = [multiprocessing.Process(target=stealing_worker, daemon=True,
+                                    args=(csp, inference, counting, w,
+                                          inboxes[w], results, hungry))
+            for w in range(workers)]
+    for worker in team:
+        worker.start()
+    tasks, idle, busy = deque([()]), list(range(workers)), 0
+    try:
+        while True:
+            while tasks and idle:
+                inboxes[idle.pop()].put(tasks.popleft())
+                busy += 1
+            if not busy:
+                break
+            if idle and not tasks:
+                with hungry.get_lock():
+                    hungry.value = len(idle)
+            kind, w, payload = results.get()
+            if kind == 'split':
+                tasks.extend(payload)
+            elif kind == 'solution':
+                yield payload
+            elif kind == 'error':
+                raise payload
+            else:
+                busy -= 1
+                idle.append(w)
+                if counting:
+                    yield payload
+        for inbox in inboxes:
+            inbox.put(None)
+        for worker in team:
+            worker.join()
+    finally:
+        for worker in team:
+            if worker.is_alive():
+                worker.terminate()
+
+
+def stealing_worker(csp, inference, counting, w, inbox, results, hungry):
+    """Search the tasks sent to inbox, one at a time, reporting each
+    solution (or the task's count) to results, and giving work away while
+    hungry says some worker is waiting for it. An exception raised by the
+    search is reported to results too, and ends the worker."""
+    csp.support_pruning()
+    demand = hungry.get_obj()
+    assignment = {}
+
+    def share(prefix, path, levels):
+        for i, (var, values) in enumerate(levels):
+            if values:
+                with hungry.get_lock():
+                    if hungry.value <= 0:
+                        return
+                    hungry.value -= 1
+                given = values[:(len(values) + 1) // 2]
+                del values[:len(given)]
+                head = prefix + tuple(path[:i])
+                results.put(('split', w, [head + ((var, value),) for value in given]))
+                return
+
+    def extend(var, value):
+        if csp.nconflicts(var, value, assignment):
+            return None
+        csp.assign(var, value, assignment)
+        removals = csp.suppose(var, value)
+        if inference(csp, var, value, assignment, removals):
+            return removals
+        csp.restore(removals)
+        csp.unassign(var, assignment)
+        return None
+
+    for prefix in iter(inbox.get, None):
+        start, found = len(csp.trail), 0
+        path, levels = [], []
+
+        def explore():
+            nonlocal found
+            if len(assignment) == len(csp.variables):
+                if counting:
+                    found += 1
+                else:
+                    results.put(('solution', w, dict(assignment)))
+                return
+            var = mrv(assignment, csp)
+            values = list(csp.choices(var))
+            levels.append((var, values))
+            while values:
+                if demand.value > 0:
+                    share(prefix, path, levels)
+                    if not values:
+                        break
+                value = values.pop()
+                removals = extend(var, value)
+                if removals is not None:
+                    path.append((var, value))
+                    explore()
+                    path.pop()
+                    csp.restore(removals)
+                    csp.unassign(var, assignment)
+            levels.pop()
+
+        try:
+            if all(extend(var, value) is not None for var, value in prefix):
+                explore()
+        except Exception as exc:
+            results.put(('error', w, exc))
+            return
+        for var in list(assignment):
+            csp.unassign(var, assignment)
+        csp.restore(start)
+        results.put(('done', w, found))
+
+
+# ______________________________________________________________________________
+# Incremental solving of an edited problem
+
+
+class Session:
+    """Keep a CSP and its last solution across small edits of the
+    problem: neighbors joined or separated, domains changed, entries of a
+    TableConstraint chart changed. Each edit notes the variables whose
+    value it may have made wrong, so solve() only checks those. If some
+    are wrong it repairs the solution locally: those variables are
+    searched again with the rest of the solution held fixed, and if that
+    fails, also their neighbors, and theirs, up to radius steps out. Only
+    then does it fall back to backtracking_search with the keyword
+    arguments config (read as the entries of portfolio are). A problem
+    found unsolvable stays so under edits that only tighten it, without
+    a search. The edits change csp itself, which must not be compiled.
+
+    The propagation is kept between calls too, as prunings of the
+    current domains of csp on its trail, and repairs and searches start
+    from those domains. solve() makes them arc consistent after an edit
+    that relaxes the problem, starting again from the full domains, and
+    after a new neighbor or a smaller domain, revising only the arcs it
+    touched. A forbidden chart entry would touch nearly every arc, so the
+    prunings are just kept as they are: the problem only got tighter."""
+
+    def __init__(self, csp, radius=2, **config):
+        if isinstance(csp, CompiledCSP):
+            raise TypeError('a Session edits the problem; pass it uncompiled')
+        csp.support_pruning()
+        self.csp = csp
+        self.radius = radius
+        self.config = config
+        self.solution = None
+        self.suspects = set()
+        self.relaxed = self.stale = True
+        self.repairs = self.searches = 0
+        self.base = len(csp.trail)
+        self.queue = set()
+        self.reshaped = set()
+
+    def add_constraint(self, A, B):
+        """Make A and B neighbors."""
+        csp = self.csp
+        for X, Y in ((A, B), (B, A)):
+            if Y not in csp.neighbors[X]:
+                csp.neighbors[X] = list(csp.neighbors[X]) + [Y]
+        csp.graph = None
+        self.queue |= {(A, B), (B, A)}
+        self.suspects |= {A, B}
+
+    def remove_constraint(self, A, B):
+        """Make A and B independent."""
+        csp = self.csp
+        for X, Y in ((A, B), (B, A)):
+            csp.neighbors[X] = [Z for Z in csp.neighbors[X] if Z != Y]
+        csp.graph = None
+        self.relaxed = True
+
+    def change_domain(self, var, values):
+        """Give var the domain values."""
+        csp, values = self.csp, list(values)
+        if set(values) <= set(csp.domains[var]):
+            for x in csp.choices(var):
+                if x not in values:
+                    csp.prune(var, x, self.base)
+            self.queue.update((Y, var) for Y in csp.linked(var))
+        else:
+            self.relaxed = True
+        csp.domains[var] = values
+        self.reshaped.add(var)
+        self.suspects.add(var)
+
+    def change_entry(self, a, b, allowed):
+        """Allow or forbid value a next to value b in the chart of the
+        TableConstraint the problem is built on."""
+        self.csp.constraints.allow(a, b, allowed)
+        if allowed:
+            self.relaxed = True
+        elif self.solution is not None:
+            self.suspects.update(X for X, x in self.solution.items() if x == a)
+
+    def propagate(self, relaxed):
+        """Make the current domains arc consistent again after the edits,
+        with AC3 and the global constraints' filtering: from the full
+        domains if one relaxed the problem, else from the queued arcs.
+        Return False on a wipeout."""
+        csp = self.csp
+        if relaxed:
+            csp.restore(self.base)
+            for X in self.reshaped:
+                csp.curr_domains[X] = ReversibleDomain(csp.domains[X])
+            self.reshaped.clear()
+            queue = None
+        else:
+            queue = self.queue
+        self.queue = set()
+        return (AC3(csp, queue, self.base) and
+                propagate_globals(csp, self.base, AC3))
+
+    def solve(self):
+        """Return a solution of the problem as it now stands, or None."""
+        csp, solution = self.csp, self.solution
+        suspects, self.suspects = self.suspects, set()
+        relaxed, self.relaxed = self.relaxed, False
+        if csp.counter is not None and (suspects or relaxed):
+            csp.count_conflicts()
+        if not self.propagate(relaxed):
+            self.stale = False
+            self.solution = None
+            return None
+        if self.stale:
+            self.stale = False
+        elif solution is None:
+            if not relaxed:
+                return None
+        else:
+            wrong = {X for X in suspects
+                     if solution[X] not in csp.domains[X] or csp.nconflicts(X, solution[X], solution)}
+            # A value propagation took out cannot be held fixed
+            wrong.update(X for X in csp.variables if solution[X] not in csp.curr_domains[X])
+            if not wrong:
+                return solution
+            for _ in range(self.radius + 1):
+                self.repairs += 1
+                repaired = self.repair(wrong)
+                if repaired is not None or len(wrong) == len(csp.variables):
+                    self.solution = repaired
+                    return repaired
+                wrong = wrong.union(*(csp.linked(X) for X in wrong))
+        self.searches += 1
+        start = len(csp.trail)
+        self.solution = configured_search(csp, self.config)
+        csp.restore(start)
+        return self.solution
+
+    def repair(self, free):
+        """Search values for the variables free, with the others fixed at
+        their values in the last solution, by forward checking with the
+        smallest domain first. Return the new solution or None."""
+        csp = self.csp
+        csp.support_pruning()
+        start = len(csp.trail)
+        assignment = {X: x for X, x in self.solution.items() if X not in free}
+        for X, x in assignment.items():
+            csp.suppose(X, x)
+        for X in free:
+            for x in csp.choices(X):
+                if csp.nconflicts(X, x, assignment):
+                    csp.prune(X, x, start)
+        # The constraints of the fixed variables on the free ones, seen from their side
+        for Y, y in assignment.items():
+            if any(X in free for X in csp.neighbors[Y]):
+                if not forward_checking(csp, Y, y, assignment, start):
+                    csp.restore(start)
+                    return None
+
+        def backtrack():
+            if len(assignment) == len(csp.variables):
+                return True
+            var = min((X for X in free if X not in assignment), key=csp.domain_size)
+            for value in csp.choices(var):
+                if 0 == csp.nconflicts(var, value, assignment):
+                    csp.assign(var, value, assignment)
+                    removals = csp.suppose(var, value)
+                    if forward_checking(csp, var, value, assignment, removals) and backtrack():
+                        return True
+                    csp.restore(removals)
+            csp.unassign(var, assignment)
+            return False
+
+        result = dict(assignment) if backtrack() else None
+        csp.restore(start)
+        return result
+
+
+# ______________________________________________________________________________
+# Min-conflicts Hill Climbing search for CSPs
+
+
+class ConflictCounter(Monitor):
+    """For every variable and every value of its original domain, the
+    number of assigned variables that value would conflict with, kept up
+    to date from the assign/unassign calls the CSP reports: a change of Y
+    only touches the values of Y's neighbors that clash with Y's old and
+    new value. Global constraints other than AllDifferent are not
+    counted: nconflicts asks them. conflicted lists the assigned variables
+    whose current value clashes with something, those constraints
+    included. Call detach() when done.
+
+    The counts are of one assignment, source: when the CSP is handed
+    another, follow() recounts for it."""
+
+    def __init__(self, csp):
+        self.current = {}
+        self.source = None
+        self.table = {var: dict.fromkeys(csp.domains[var], 0) for var in csp.variables}
+        self.watchers = {var: [] for var in csp.variables}
+        for X in csp.variables:
+            for Y in csp.neighbors[X]:
+                self.watchers[Y].append(X)
+        self.uncounted = {var: [g for g in csp.globals_of[var] if not isinstance(g, AllDifferent)]
+                          for var in csp.variables}
+        self.conflicted = []
+        self.position = {}
+        self.attach(csp)
+
+    def nconflicts(self, var, val):
+        conflicts = self.table[var][val]
+        for g in self.uncounted[var]:
+            conflicts += g.nconflicts(self.csp, var, val, self.current)
+        return conflicts
+
+    def knows(self, var, val, assignment):
+        """Whether the table holds the count of var=val in assignment."""
+        return (assignment is self.source and len(assignment) == len(self.current)
+                and val in self.table.get(var, ()))
+
+    def follow(self, assignment):
+        """Make assignment the source, recounting if it was not."""
+        if assignment is not self.source:
+            for var in list(self.current):
+                self.on_unassign(var)
+            self.source = assignment
+            for var, val in assignment.items():
+                self.on_assign(var, val)
+
+    def on_assign(self, var, val):
+        if var in self.current:
+            self.update(var, self.current[var], -1)
+        self.current[var] = val
+        self.update(var, val, +1)
+        self.refresh(var)
+        self.refresh_uncounted(var)
+
+    def on_unassign(self, var):
+        if var in self.current:
+            self.update(var, self.current.pop(var), -1)
+            self.refresh(var)
+            self.refresh_uncounted(var)
+
+    def refresh_uncounted(self, var):
+        """Refresh the scope of every uncounted constraint on var, whose
+        conflicts the table does not see change."""
+        for g in self.uncounted[var]:
+            for X in g.scope:
+                self.refresh(X)
+
+    def update(self, Y, b, delta):
+        """Add delta to the count of every value clashing with Y=b."""
+        csp, table = self.csp, self.table
+        for X in self.watchers[Y]:
+            row = table[X]
+            for a in self.clashing(X, Y, b):
+                row[a] += delta
+            self.refresh(X)
+        for g in csp.globals_of[Y]:
+            if not isinstance(g, AllDifferent):
+                continue
+            label = csp.label(Y, b)
+            for X in g.scope:
+                a = csp.unlabel(X, label)
+                if X != Y and a in table[X]:
+                    table[X][a] += delta
+                    self.refresh(X)
+
+    def clashing(self, X, Y, b):
+        """The values of X that conflict with Y=b."""
+        csp = self.csp
+        if isinstance(csp, CompiledCSP):
+            full = (1 << len(csp.val_names[X])) - 1
+            return bits(full & ~csp.supports[csp.arcs[Y, X]][b])
+        return [a for a in csp.domains[X] if not csp.constraints(X, a, Y, b)]
+
+    def refresh(self, X):
+        """Keep X in conflicted iff its current value has a conflict."""
+        inside = X in self.position
+        clash = X in self.current and self.nconflicts(X, self.current[X]) > 0
+        if clash and not inside:
+            self.position[X] = len(self.conflicted)
+            self.conflicted.append(X)
+        elif inside and not clash:
+            i, last = self.position.pop(X), self.conflicted.pop()
+            if last != X:
+                self.conflicted[i] = last
+                self.position[last] = i
+
+
+def min_conflicts(csp, max_steps=100000, tabu=0, walk=0.0):
+    """[Figure 6.8] Solve a CSP by stochastic hillclimbing on the number
+    of conflicts. The counts come from a ConflictCounter instead of a call
+    to nconflicts per candidate value. With tabu=k a variable may not go
+    back to the value it just left for k steps, and with probability walk
+    a step moves to a random value instead of a best one."""
+    counter = ConflictCounter(csp)
+    tabu_until = {}
+    try:
+        # Generate a complete assignment for all variables (probably with conflicts)
+        csp.current = current = {}
+        for var in csp.variables:
+            csp.assign(var, argmin_random_tie(csp.domains[var],
+                                              key=lambda val: counter.nconflicts(var, val)), current)
+        # Now repeatedly choose a random conflicted variable and change it
+        for i in range(max_steps):
+            if not counter.conflicted:
+                return current
+            var = random.choice(counter.conflicted)
+            if walk and random.random() < walk:
+                val = random.choice(list(csp.domains[var]))
+            else:
+                allowed = [val for val in csp.domains[var]
+                           if tabu_until.get((var, val), -1) < i] or csp.domains[var]
+                val = argmin_random_tie(allowed, key=lambda val: counter.nconflicts(var, val))
+            if tabu:
+                tabu_until[var, current[var]] = i + tabu
+            csp.assign(var, val, current)
+        return None
+    finally:
+        counter.detach()
+
+
+# ______________________________________________________________________________
+# The structure of problems: cycle cutsets
+
+
+def constraint_graph(csp):
+    """Map each variable of csp to the set of variables it shares a
+    constraint with: its neighbors, listed either way round, and the rest
+    of the scope of each of its global constraints."""
+    links = {var: set() for var in csp.variables}
+    for X in csp.variables:
+        for Y in csp.neighbors[X]:
+            links[X].add(Y)
+            links[Y].add(X)
+    for g in csp.global_constraints:
+        for X in g.scope:
+            links[X].update(Y for Y in g.scope if Y != X)
+    return links
+
+
+def is_forest(links, removed=()):
+    """Is the graph links, without the variables removed, free of cycles?"""
+    index = {X: i for i, X in enumerate(links)}
+    root = {}
+
+    def find(X):
+        while root.get(X, X) != X:
+            X = root[X]
+        return X
+
+    for X in links:
+        if X not in removed:
+            for Y in links[X]:
+                if Y not in removed and index[X] < index[Y]:
+                    a, b = find(X), find(Y)
+                    if a == b:
+                        return False
+                    root[a] = b
+    return True
+
+
+def cycle_cutset(csp):
+    """Return a small list of variables whose removal leaves the
+    constraint graph of csp a forest. Variables of degree 0 or 1 lie on no
+    cycle and are stripped, repeatedly; then the variable of highest degree
+    goes into the cutset, and so on until the graph is empty. Finally each
+    variable of the cutset whose return would close no cycle is put back."""
+    links = constraint_graph(csp)
+    graph = {X: set(Ys) for X, Ys in links.items()}
+    cutset = []
+
+    def remove(X):
+        for Y in graph.pop(X):
+            graph[Y].discard(X)
+
+    while graph:
+        leaves = [X for X in graph if len(graph[X]) <= 1]
+        while leaves:
+            X = leaves.pop()
+            if X in graph:
+                neighbors = graph[X]
+                remove(X)
+                leaves.extend(Y for Y in neighbors if len(graph[Y]) <= 1)
+        if graph:
+            X = max(graph, key=lambda X: len(graph[X]))
+            cutset.append(X)
+            remove(X)
+    for X in reversed(list(cutset)):
+        if is_forest(links, set(cutset) - {X}):
+            cutset.remove(X)
+    return cutset
+
+
+def cutset_conditioning(csp, cutset=None, inference=forward_checking):
+    """[Section 6.5.2] Search over the assignments of a cycle cutset of
+    csp (default: cycle_cutset(csp)) alone. Once the cutset is assigned the
+    rest of the problem is a forest, solved by solve_forest() in O(n d^2)
+    time with no backtracking, so the whole search costs O(d^c n d^2) for
+    a cutset of c variables. Return a solution, or None; either way csp is
+    left as it was."""
+    links = constraint_graph(csp)
+    cutset = cycle_cutset(csp) if cutset is None else list(cutset)
+    if not is_forest(links, set(cutset)):
+        raise ValueError('not a cycle cutset: {}'.format(cutset))
+    rest = [X for X in csp.variables if X not in set(cutset)]
+    csp.support_pruning()
+    start = len(csp.trail)
+    assignment = {}
+
+    def condition(i):
+        if i == len(cutset):
+            return solve_forest(csp, rest, links, assignment, len(csp.trail))
+        var = cutset[i]
+        for value in csp.choices(var):
+            if 0 == csp.nconflicts(var, value, assignment):
+                csp.assign(var, value, assignment)
+                removals = csp.suppose(var, value)
+                if inference(csp, var, value, assignment, removals) and condition(i + 1):
+                    return True
+                csp.restore(removals)
+        csp.unassign(var, assignment)
+        return False
+
+    result = dict(assignment) if condition(0) else None
+    for var in list(assignment):
+        csp.unassign(var, assignment)
+    csp.restore(start)
     return result
 
-def update_domain(csp, assignment):
-    print('\n')
 
-    csp.display(assignment)
-    for Xi in csp.variables:
-        #domain = csp.curr_domains[Xi]
-        print("Asignados",assignment,Xi)
-        domain = csp.actions2(Xi,assignment)
-        print(Xi, '->', domain)
+def tree_csp_solver(csp):
+    """[Figure 6.11] Solve a CSP whose constraint graph is a tree, or a
+    forest, in O(n d^2) time with no backtracking: see solve_forest().
+    Return a solution, or None; either way csp is left as it was.
+    A chart need not be symmetric; each side that lists the other as a
+    neighbor holds it to the chart:
+    >>> chart = TableConstraint({'a': ['b'], 'b': ['b']})
+    >>> problem = CSP([0, 1], {0: 'ab', 1: 'ab'}, {0: [1], 1: [0]}, chart)
+    >>> solution = tree_csp_solver(problem)
+    >>> solution, problem.goal_test(solution)
+    ({0: 'b', 1: 'b'}, True)
+    """
+    links = constraint_graph(csp)
+    if not is_forest(links):
+        raise ValueError('the constraint graph is not a forest')
+    csp.support_pruning()
+    start = len(csp.trail)
+    assignment = {}
+    solved = solve_forest(csp, csp.variables, links, assignment, start)
+    result = dict(assignment) if solved else None
+    for var in list(assignment):
+        csp.unassign(var, assignment)
+    csp.restore(start)
+    return result
+
+
+def solve_forest(csp, variables, links, assignment, removals):
+    """Extend assignment to the variables, whose links form a forest,
+    within their current domains. Values in conflict with the assignment
+    are pruned, each tree is made arc consistent from the leaves up
+    (directional arc consistency), and then every variable takes a value
+    that agrees with its parent's, which the first step guarantees to
+    exist. Return False if a domain is wiped out."""
+    free = set(variables)
+    for X in variables:
+        listing = [Y for Y in links[X] if Y in assignment and X in csp.neighbors[Y]]
+        for x in list(csp.choices(X)):
+            if (csp.nconflicts(X, x, assignment) or
+                    not all(csp.constraints(Y, assignment[Y], X, x) for Y in listing)):
+                csp.prune(X, x, removals)
+        if not csp.domain_size(X):
+            return False
+    trees, seen = [], set()
+    for root in variables:
+        if root not in seen:
+            order, parent = topological_sort(links, root, free)
+            seen.update(order)
+            for Xj in reversed(order[1:]):
+                if not make_arc_consistent(csp, parent[Xj], Xj, removals, assignment):
+                    return False
+            trees.append((order, parent))
+    for order, parent in trees:
+        for Xj in order:
+            Xi = parent[Xj]
+            csp.assign(Xj, first(x for x in csp.choices(Xj)
+                                 if Xi is None or agree(csp, Xi, assignment[Xi], Xj, x, assignment)),
+                       assignment)
+    return True
+
+
+def topological_sort(links, root, allowed):
+    """Order the tree of links (within the allowed variables) that holds
+    root, so that every variable comes after its parent. Return the order
+    and the parent of each variable, None for the root."""
+    order, parent = [root], {root: None}
+    for X in order:
+        for Y in links[X]:
+            if Y in allowed and Y not in parent:
+                parent[Y] = X
+                order.append(Y)
+    return order, parent
+
+
+def make_arc_consistent(csp, Xi, Xj, removals, assignment):
+    """Remove the values of Xi that agree with no value of Xj; return
+    False if none is left."""
+    if isinstance(csp, CompiledCSP) and not any(Xj in g.scope for g in csp.globals_of[Xi]):
+        revise(csp, Xi, Xj, removals)
+    else:
+        others = list(csp.choices(Xj))
+        for x in list(csp.choices(Xi)):
+            if not any(agree(csp, Xi, x, Xj, y, assignment) for y in others):
+                csp.prune(Xi, x, removals)
+    return csp.domain_size(Xi) > 0
+
+
+def agree(csp, A, a, B, b, assignment):
+    """Can A=a and B=b hold together, given assignment? A and B must be
+    linked in the constraint graph. The binary constraint is checked from
+    each side that lists the other among its neighbors, as goal_test
+    does; a global constraint linking them is checked with the rest of
+    its scope as assigned."""
+    if B in csp.neighbors[A] and not csp.constraints(A, a, B, b):
+        return False
+    if A in csp.neighbors[B] and not csp.constraints(B, b, A, a):
+        return False
+    shared = [g for g in csp.globals_of[A] if B in g.scope]
+    if not shared:
+        return True
+    assignment[B] = b
+    try:
+        return not any(g.nconflicts(csp, A, a, assignment) for g in shared)
+    finally:
+        del assignment[B]
+
+
+# ______________________________________________________________________________
+# The structure of problems: tree decompositions
+
+
+def min_fill_order(links):
+    """Return an elimination order of the graph links: each time, the
+    variable whose neighbors need the fewest edges added to become a
+    clique (fewest neighbors on a tie) is eliminated, and those edges are
+    added. Only the variables near the one eliminated are rescored."""
+    graph = {X: set(Ys) for X, Ys in links.items()}
+    index = {X: i for i, X in enumerate(links)}
+
+    def score(X):
+        Ys = list(graph[X])
+        fill = sum(1 for i, Y in enumerate(Ys) for Z in Ys[i + 1:] if Z not in graph[Y])
+        return fill, len(Ys)
+
+    scores = {X: score(X) for X in graph}
+    heap = [scores[X] + (index[X],) for X in graph]
+    heapq.heapify(heap)
+    variables = list(links)
+    order = []
+    while heap:
+        fill, degree, i = heapq.heappop(heap)
+        X = variables[i]
+        if X not in graph or scores[X] != (fill, degree):
+            continue
+        order.append(X)
+        Ys = graph.pop(X)
+        for Y in Ys:
+            graph[Y].discard(X)
+            graph[Y] |= Ys - {Y}
+        near = set(Ys)
+        for Y in Ys:
+            near |= graph[Y]
+        for Y in near:
+            new = score(Y)
+            if new != scores[Y]:
+                scores[Y] = new
+                heapq.heappush(heap, new + (index[Y],))
+    return order
+
+
+# Semirings (plus, times, zero, one) the messages of a JoinTree are computed in
+EXISTS = (operator.or_, operator.and_, False, True)
+COUNT = (operator.add, operator.mul, 0, 1)
+MINCOST = (min, operator.add, search.infinity, 0)
+
+
+class JoinTree:
+    """A tree decomposition of the constraint graph of csp, made by
+    eliminating its variables in order (default: min_fill_order). The bag
+    of X holds X and its neighbors when X is eliminated, all of which come
+    later; the rest of the bag is its separator, and the parent of the bag
+    is the bag of the first variable of the separator. Every constraint is
+    checked in the bag of the first of its variables to be eliminated.
+    Queries pass one message up from each bag to its parent, a table
+    over the separator that sums up the subtree below, and then, to
+    build a solution, choose values from the roots down. Only the messages
+    are kept, so memory is bounded by d^(separator size), and time by
+    n d^(width + 1)."""
+
+    def __init__(self, csp, order=None):
+        self.csp = csp
+        links = constraint_graph(csp)
+        self.order = list(order or min_fill_order(links))
+        position = {X: i for i, X in enumerate(self.order)}
+        graph = {X: set(Ys) for X, Ys in links.items()}
+        self.bags, self.parent = {}, {}
+        self.children = defaultdict(list)
+        for X in self.order:
+            later = graph.pop(X)
+            for Y in later:
+                graph[Y].discard(X)
+                graph[Y] |= later - {Y}
+            self.bags[X] = [X] + sorted(later, key=position.get)
+            self.parent[X] = self.bags[X][1] if later else None
+            if later:
+                self.children[self.parent[X]].append(X)
+        self.width = max((len(bag) for bag in self.bags.values()), default=1) - 1
+        self.binary = {X: [(Y, Y in csp.neighbors[X], X in csp.neighbors[Y])
+                           for Y in links[X] if position[Y] > position[X]]
+                       for X in self.order}
+        self.globals = defaultdict(list)
+        for g in csp.global_constraints:
+            self.globals[min(g.scope, key=position.get)].append(g)
+
+    def consistent(self, X, values):
+        """Do the constraints checked in the bag of X hold for values? A
+        binary constraint is checked from each side that lists the other
+        as a neighbor, as goal_test does."""
+        csp, x = self.csp, values[X]
+        return (all((not forward or csp.constraints(X, x, Y, values[Y])) and
+                    (not backward or csp.constraints(Y, values[Y], X, x))
+                    for Y, forward, backward in self.binary[X]) and
+                all(g.nconflicts(csp, Z, values[Z], values) == 0
+                    for g in self.globals[X] for Z in g.scope))
+
+    def value(self, X, x, values, messages, semiring, cost):
+        """What X=x contributes, with the separator of X as in values."""
+        plus, times, zero, one = semiring
+        values[X] = x
+        if not self.consistent(X, values):
+            return zero
+        result = one if cost is None else cost(X, x)
+        for child in self.children[X]:
+            key = tuple(values[Y] for Y in self.bags[child][1:])
+            result = times(result, messages[child].get(key, zero))
+        return result
+
+    def messages(self, semiring, cost=None):
+        """Compute the message of every bag, leaves first. Separator values
+        whose message is zero are not stored."""
+        csp = self.csp
+        plus, times, zero, one = semiring
+        csp.support_pruning()
+        messages = {}
+        for X in self.order:
+            separator = self.bags[X][1:]
+            table = messages[X] = {}
+            for key in itertools.product(*[csp.choices(Y) for Y in separator]):
+                values = dict(zip(separator, key))
+                total = zero
+                for x in csp.choices(X):
+                    total = plus(total, self.value(X, x, values, messages, semiring, cost))
+                if total != zero:
+                    table[key] = total
+        return messages
+
+    def total(self, messages, semiring):
+        """Combine the messages of the roots."""
+        plus, times, zero, one = semiring
+        return reduce(times, (messages[X].get((), zero) for X in self.order
+                              if self.parent[X] is None), one)
+
+    def decode(self, messages, semiring, cost):
+        """Choose the values from the roots down, each the best for its
+        bag given the values above it."""
+        plus, times, zero, one = semiring
+        solution = {}
+        for X in reversed(self.order):
+            values = {Y: solution[Y] for Y in self.bags[X][1:]}
+            scored = [(self.value(X, x, values, messages, semiring, cost), x)
+                      for x in self.csp.choices(X)]
+            best = reduce(plus, (v for v, x in scored), zero)
+            solution[X] = first(x for v, x in scored if v == best)
+        return solution
+
+    def solve(self):
+        """Return a solution, or None."""
+        messages = self.messages(EXISTS)
+        if not self.total(messages, EXISTS):
+            return None
+        return self.decode(messages, EXISTS, None)
+
+    def count(self):
+        """Return the number of solutions."""
+        return self.total(self.messages(COUNT), COUNT)
+
+    def minimize(self, cost):
+        """Return (total cost, solution) for a solution of least total
+        cost(var, value) over all variables, or None if there is none."""
+        messages = self.messages(MINCOST, cost)
+        best = self.total(messages, MINCOST)
+        if best == search.infinity:
+            return None
+        return best, self.decode(messages, MINCOST, cost)
+
+
+
+# ______________________________________________________________________________
+# Weighted CSPs: optimization by branch and bound
+
+
+class CostChart:
+    """A graded chart {value: {other value: cost}} applied to every pair
+    of neighbors, as a TableConstraint is: costs(A, a, B, b) is what the
+    chart says for a next to b, and default for a pair it does not list."""
+
+    def __init__(self, chart, default=search.infinity):
+        self.chart = chart
+        self.default = default
+
+    def __call__(self, A, a, B, b):
+        return self.chart.get(a, {}).get(b, self.default)
+
+
+class WeightedCSP(CSP):
+    """A CSP whose binary constraints are graded: costs(A, a, B, b) is the
+    cost of A=a next to B=b, 0 for a perfect match and search.infinity
+    for a forbidden pair, and unary(var, val), if given, the cost of
+    var=val itself. A pair is allowed iff its cost is finite, so it is
+    still a CSP for every other solver here; cost(assignment) is the
+    total to minimize, with each pair of neighbors counted once, from the
+    side of the variable that comes first. Global constraints stay hard."""
+
+    def __init__(self, variables, domains, neighbors, costs, unary=None,
+                 global_constraints=()):
+        CSP.__init__(self, variables, domains, neighbors, self.allowed, global_constraints)
+        self.costs = costs
+        self.unary = unary
+        self.position = {var: i for i, var in enumerate(self.variables)}
+
+    def allowed(self, A, a, B, b):
+        return self.pair_cost(A, a, B, b) < search.infinity
+
+    def unary_cost(self, var, val):
+        return self.unary(var, val) if self.unary else 0
+
+    def pair_cost(self, A, a, B, b):
+        """The cost of the constraint between A and B, read from the side
+        of the one that comes first."""
+        if self.position[A] < self.position[B]:
+            return self.costs(A, a, B, b)
+        return self.costs(B, b, A, a)
+
+    def cost(self, assignment):
+        """The total cost of a complete assignment."""
+        total = sum(self.unary_cost(var, val) for var, val in assignment.items())
+        for A, B in self.pairs():
+            total += self.pair_cost(A, assignment[A], B, assignment[B])
+        return total
+
+    def pairs(self):
+        """Every pair of neighbors once, the one that comes first first."""
+        for A in self.variables:
+            for B in set(self.neighbors[A]):
+                if self.position[A] < self.position[B] or A not in self.neighbors[B]:
+                    yield (A, B) if self.position[A] < self.position[B] else (B, A)
+
+
+def branch_and_bound(wcsp, upper=search.infinity, monitors=()):
+    """Generate solutions of a WeightedCSP of ever lower cost, below upper,
+    as (cost, solution) pairs: the last one is optimal. The search is
+    depth first, cheapest value first, and a branch is cut as soon as a
+    lower bound on its cost reaches the best cost found so far. The bound
+    is that of forward checking with directional arc consistency counts
+    (PFC-DAC), a form of soft arc consistency: the cost of the assigned
+    variables, plus for each unassigned variable its cheapest value,
+    counting its unary cost, its costs with the assigned variables, and
+    for each later neighbor the cheapest cost with any of its values.
+    Every cost function is counted in one place only, so the sum never
+    overestimates. Values that would lift the bound to the best cost are
+    pruned, and each solution found is reported to the monitors'
+    on_solution before it is yielded. Closing the generator early, or
+    exhausting it, leaves wcsp as it was."""
+    wcsp.support_pruning()
+    position = wcsp.position
+    links = {var: set() for var in wcsp.variables}
+    for A, B in wcsp.pairs():
+        links[A].add(B)
+        links[B].add(A)
+    # Cheapest cost of each value with any value of each later neighbor
+    dac = {(X, Z): {x: min((wcsp.pair_cost(X, x, Z, z) for z in wcsp.domains[Z]),
+                           default=search.infinity)
+                    for x in wcsp.domains[X]}
+           for X in wcsp.variables for Z in links[X] if position[X] < position[Z]}
+    partial = {X: {x: wcsp.unary_cost(X, x) for x in wcsp.domains[X]} for X in wcsp.variables}
+    ahead = {X: {x: sum(dac[X, Z][x] for Z in links[X] if position[X] < position[Z])
+                 for x in wcsp.domains[X]}
+             for X in wcsp.variables}
+    assignment, unassigned = {}, set(wcsp.variables)
+    undo = []
+    best, spent = upper, 0
+
+    def term(X, x):
+        return partial[X][x] + ahead[X][x]
+
+    def update(var, val):
+        """Move the costs with var=val into its neighbors' partial costs."""
+        for Y in links[var]:
+            if Y in unassigned:
+                row, estimate = partial[Y], ahead[Y]
+                for y in wcsp.choices(Y):
+                    undo.append((row, y, row[y]))
+                    row[y] += wcsp.pair_cost(Y, y, var, val)
+                    if position[Y] < position[var]:
+                        undo.append((estimate, y, estimate[y]))
+                        estimate[y] -= dac[Y, var][y]
 
+    def filter(removals):
+        """Prune the values that would lift the bound to best; return
+        False if the bound itself reaches it."""
+        least = {X: min(term(X, x) for x in wcsp.choices(X)) for X in unassigned}
+        bound = spent + sum(least.values())
+        if bound >= best:
+            return False
+        for X in unassigned:
+            for x in wcsp.choices(X):
+                if bound - least[X] + term(X, x) >= best:
+                    wcsp.prune(X, x, removals)
+        return True
 
+    def branch():
+        nonlocal best, spent
+        if not unassigned:
+            best = spent
+            yield spent, MappingProxyType(dict(assignment))
+            return
+        var = min(unassigned, key=lambda X: (wcsp.domain_size(X), position[X]))
+        for val in sorted(wcsp.choices(var), key=lambda x: term(var, x)):
+            if any(g.nconflicts(wcsp, var, val, assignment) for g in wcsp.globals_of[var]):
+                continue
+            removals = wcsp.suppose(var, val)
+            mark, before = len(undo), spent
+            spent += partial[var][val]
+            wcsp.assign(var, val, assignment)
+            unassigned.discard(var)
+            update(var, val)
+            if filter(removals):
+                yield from branch()
+            while len(undo) > mark:
+                row, y, old = undo.pop()
+                row[y] = old
+            unassigned.add(var)
+            wcsp.unassign(var, assignment)
+            spent = before
+            wcsp.restore(removals)
 
+    start = len(wcsp.trail)
+    for monitor in monitors:
+        monitor.attach(wcsp)
+    try:
+        if filter(start):
+            for solution in branch():
+                for monitor in wcsp.monitors:
+                    monitor.on_solution(solution[1])
+                yield solution
+    finally:
+        for var in list(assignment):
+            wcsp.unassign(var, assignment)
+        wcsp.restore(start)
+        for monitor in monitors:
+            monitor.detach()
 
 
+def best_solution(wcsp, upper=search.infinity):
+    """Return (cost, solution) for a solution of least cost below upper,
+    or None."""
+    best = None
+    for best in branch_and_bound(wcsp, upper):
+        pass
+    return best
 
 
 #
 #-------------------- CSP problem formulation ----------------
 #
 # Constraint : neigboring nodes cannot have the same color
-def different_values_constraint(A, a, B,assignment):
+def different_values_constraint(A, a, B, b):
     """A constraint saying two neighboring variables must differ in value."""
     Restriccion = {'F': ['T','D'],
     			 'D': ['F','M'],
     			 'M': ['D','P'],
     			 'P': ['M','T'],
     			 'T': ['P','F']}
-    print("Values",A,a,B,assignment[B])
-    return (a != assignment[B]) #and not(a in Restriccion[b)
+    return (a != b) #and not(a in Restriccion[b)
     '''for id,node in assignment.items():
         if a == node:
             return 0
@@ -218,7 +2937,6 @@ neighbors = {1: [3,4,5],
 			 5: [2,4]}
 # Initially, all variables have as domain {red, green, blue} colors
 domains = dict.fromkeys(variables, 'FDMPT')
-print(domains)
 # Construction of the CSP problem
 network = CSP(variables, domains, neighbors, different_values_constraint)
 #
@@ -241,7 +2959,7 @@ network = CSP(variables, domains, neighbors, different_values_constraint)
 def main(argv):
 	#gui.init_gui()
 
-	result = backtracking_search(network)
+	result = backtracking_search(network, monitors=[DomainReport()])
 
 	#gui.wait()
 